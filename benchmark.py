@@ -0,0 +1,537 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from rate_limiter import RateLimiter
+import scraper
+
+#Offline benchmark of the scraping pipeline
+#Product pages are served from a local fixture server, S3 is replaced by moto and RDS by a SQLite file, so the numbers only depend on our own code
+
+STAGES = ("_create_url_list", "_scrape", "save", "upload")
+
+#Stage name -> Scraper method that is timed for it, _scrape_card dispatches to _scrape or _scrape_http depending on the engine
+STAGE_METHODS = {
+    "_create_url_list": "_create_url_list",
+    "_scrape": "_scrape_card",
+    "save": "save",
+    "upload": "upload",
+}
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>{name} | Cardmarket</title></head>
+<body>
+<h1>{name}<span>Benchmark Set Singles</span></h1>
+<div class="image card-image"><img class="is-front" src="/img/{number:03d}.jpg" alt="{name}"></div>
+<dl class="labeled row no-gutters mx-auto">
+<dt class="col-6 col-xl-5">Rarity</dt><dd class="col-6 col-xl-7"><span class="icon" data-original-title="{rarity}"></span></dd>
+<dt class="col-6 col-xl-5">Number</dt><dd class="col-6 col-xl-7">{number}</dd>
+<dt class="col-6 col-xl-5">Printed in</dt><dd class="col-6 col-xl-7"><a href="#">Benchmark Set</a></dd>
+<dt class="col-6 col-xl-5">Reprints</dt><dd class="col-6 col-xl-7"><a href="#">Show Reprints ({versions})</a></dd>
+<dt class="col-6 col-xl-5">Available items</dt><dd class="col-6 col-xl-7">{available}</dd>
+<dt class="col-6 col-xl-5">From</dt><dd class="col-6 col-xl-7">{low} €</dd>
+<dt class="col-6 col-xl-5">Price Trend</dt><dd class="col-6 col-xl-7"><span>{trend} €</span></dd>
+<dt class="col-6 col-xl-5">30-days average price</dt><dd class="col-6 col-xl-7"><span>{avg30} €</span></dd>
+<dt class="col-6 col-xl-5">7-days average price</dt><dd class="col-6 col-xl-7"><span>{avg7} €</span></dd>
+<dt class="col-6 col-xl-5">1-day average price</dt><dd class="col-6 col-xl-7"><span>{avg1} €</span></dd>
+</dl>
+</body>
+</html>
+"""
+
+def _euro(value) -> str:
+    """
+    Formats a price the way cardmarket does e.g. 1,25
+    """
+    return f"{value:.2f}".replace('.', ',')
+
+def synthetic_pages(card_count, seed=0) -> dict:
+    """
+    Renders product pages for card_count made up cards
+
+    Parameters
+    ----------
+    card_count : int
+        Number of pages to render
+    seed : int
+        Seed of the made up prices and counts
+
+    Returns
+    -------
+    dict
+        Card name -> page html
+    """
+    rng = random.Random(seed)
+    pages = {}
+    for number in range(1, card_count + 1):
+        name = f"Benchmark Card {number:03d}"
+        trend = rng.uniform(0.02, 40)
+        pages[name] = PAGE_TEMPLATE.format(
+            name=name,
+            number=number,
+            rarity=rng.choice(("Common", "Uncommon", "Rare", "Mythic")),
+            versions=rng.randint(1, 6),
+            available=rng.randint(0, 3000),
+            low=_euro(trend * 0.6),
+            trend=_euro(trend),
+            avg30=_euro(trend * rng.uniform(0.8, 1.2)),
+            avg7=_euro(trend * rng.uniform(0.9, 1.1)),
+            avg1=_euro(trend * rng.uniform(0.95, 1.05)),
+        )
+    return pages
+
+def recorded_pages(pages_dir) -> dict:
+    """
+    Loads product pages saved from cardmarket as <url slug>.html e.g. Ancestral-Katana.html
+
+    Parameters
+    ----------
+    pages_dir : str
+        Directory of the saved pages
+
+    Returns
+    -------
+    dict
+        Card name -> page html, with the name rebuilt from the slug
+    """
+    pages = {}
+    for filename in sorted(os.listdir(pages_dir)):
+        if filename.endswith('.html'):
+            with open(os.path.join(pages_dir, filename), 'r', encoding='utf-8') as f:
+                pages[filename[:-len('.html')].replace('-', ' ')] = f.read()
+    return pages
+
+def _card_image(size) -> bytes:
+    """
+    Returns a noisy JPEG the size of a card scan, every card is served the same artwork
+    """
+    image = io.BytesIO()
+    Image.effect_noise(size, 64).convert('RGB').save(image, format='JPEG', quality=85)
+    return image.getvalue()
+
+def _slug(name) -> str:
+    """
+    Converts a card name to its url syntax, the same way Scraper._create_url_list() does
+    """
+    name = name.replace(" // ", '-')
+    name = name.translate({ord(c):None for c in "',"})
+    return name.replace(' ', '-')
+
+class FixtureServer:
+    """
+    Local HTTP server standing in for cardmarket, serving product pages and card images with injected latency and errors
+
+    Parameters
+    ----------
+    pages : dict
+        Card name -> page html
+    latency : float
+        Seconds every response is delayed by
+    jitter : float
+        Random extra delay of up to this many seconds
+    error_rate : float
+        Fraction of page requests whose connection is dropped without a response, which the scraper treats as transient
+    not_found_rate : float
+        Fraction of cards answered with 404 on every request
+    image_size : tuple[int]
+        Width and height of the served card image
+    seed : int
+        Seed of the injected errors
+
+    Attributes
+    ----------
+    pages : dict
+        Url slug -> page html
+    requests : int
+        Number of requests served
+    dropped : int
+        Number of connections dropped by error injection
+    url : str
+        Base url of the running server, None until started
+    """
+
+    def __init__(self, pages, latency=0.0, jitter=0.0, error_rate=0.0, not_found_rate=0.0, image_size=(488, 680), seed=0) -> None:
+        self.rng = random.Random(seed)
+        self.pages = {_slug(name): page.encode() for name, page in pages.items()}
+        self.missing = {slug for slug in self.pages if self.rng.random() < not_found_rate}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.image = _card_image(image_size)
+        self.requests = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.server = None
+        self.url = None
+
+    def _handler(self) -> type:
+        """
+        Returns a request handler class bound to this fixture
+        """
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def _send(self, status, body=b'', content_type='text/html; charset=utf-8', headers=None) -> None:
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                with fixture.lock:
+                    fixture.requests += 1
+                    delay = fixture.latency + fixture.rng.uniform(0, fixture.jitter)
+                    drop = fixture.rng.random() < fixture.error_rate
+                time.sleep(delay)
+
+                path = self.path.split('?')[0]
+                if path.startswith('/img/'):
+                    if self.headers.get('If-None-Match') == '"fixture"':
+                        self._send(304)
+                    else:
+                        self._send(200, fixture.image, 'image/jpeg', {'ETag': '"fixture"'})
+                    return
+
+                slug = path.rstrip('/').rsplit('/', 1)[-1]
+                if slug not in fixture.pages or slug in fixture.missing:
+                    self._send(404, b'<html><body><h1>Not found</h1></body></html>')
+                    return
+                if drop:
+                    with fixture.lock:
+                        fixture.dropped += 1
+                    self.close_connection = True
+                    return
+                self._send(200, fixture.pages[slug])
+
+        return Handler
+
+    def start(self) -> str:
+        """
+        Starts serving on a free local port in a background thread and returns the base url
+        """
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        return self.url
+
+    def stop(self) -> None:
+        """
+        Stops the server
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def _peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of this process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024    #Bytes on macOS, KB on Linux
+
+def _current_rss_mb() -> float:
+    """
+    Returns the current resident set size of this process in MB, or the peak where /proc isn't available
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return _peak_rss_mb()
+
+class RssSampler:
+    """
+    Samples the resident set size in a background thread and attributes every sample to the stages running at that moment,
+    so each stage gets its own peak even when calls of a stage overlap
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between samples
+
+    Attributes
+    ----------
+    active : dict
+        Stage name -> number of its calls running
+    peaks : dict
+        Stage name -> highest RSS in MB seen while the stage was running
+    growth : dict
+        Stage name -> largest rise in MB over the RSS the stage started at
+    """
+
+    def __init__(self, interval=0.005) -> None:
+        self.interval = interval
+        self.active = {}
+        self.peaks = {}
+        self.growth = {}
+        self.started_at = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _sample(self) -> None:
+        """
+        Records the current RSS against every running stage
+        """
+        rss = _current_rss_mb()
+        with self.lock:
+            for stage in self.active:
+                self.peaks[stage] = max(self.peaks.get(stage, 0.0), rss)
+                self.growth[stage] = max(self.growth.get(stage, 0.0), rss - self.started_at[stage])
+
+    def enter(self, stage) -> None:
+        """
+        Marks the start of a call of stage
+        """
+        rss = _current_rss_mb()
+        with self.lock:
+            if not self.active.get(stage):
+                self.active[stage] = 0
+                self.started_at[stage] = rss
+            self.active[stage] += 1
+        self._sample()
+
+    def exit(self, stage) -> None:
+        """
+        Marks the end of a call of stage
+        """
+        self._sample()
+        with self.lock:
+            self.active[stage] -= 1
+            if not self.active[stage]:
+                del self.active[stage]
+
+    def start(self) -> None:
+        """
+        Starts sampling
+        """
+        def sample_loop() -> None:
+            while not self.stopped.wait(self.interval):
+                self._sample()
+        self.thread = threading.Thread(target=sample_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops sampling
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+def _percentile(samples, percent) -> float:
+    """
+    Returns the given percentile of samples, nearest rank
+    """
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))]
+
+def _timed(method, samples, stage, sampler) -> callable:
+    """
+    Wraps a bound method so the wall time of every call is appended to samples and its memory is sampled as stage
+    """
+    def wrapper(*args, **kwargs):
+        sampler.enter(stage)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+            sampler.exit(stage)
+    return wrapper
+
+def run_once(server_url, card_names, args) -> dict:
+    """
+    Runs one cold scrape, save and upload of the fixture set in a fresh working directory, which is deleted afterwards
+
+    Parameters
+    ----------
+    server_url : str
+        Base url of the fixture server
+    card_names : list[str]
+        Names of the cards to scrape
+    args : argparse.Namespace
+        Benchmark options
+
+    Returns
+    -------
+    dict
+        Stage name -> list of call times, plus the wall time of the scrape, number of pages scraped and the peak RSS and RSS growth of each stage
+    """
+    from moto import mock_aws
+    import boto3
+
+    work_dir = tempfile.mkdtemp(prefix='mtgscraper_bench_')
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        with open('cardlist.txt', 'w') as f:
+            f.write('\n'.join(card_names) + '\n')
+
+        with mock_aws():
+            boto3.client('s3').create_bucket(Bucket='benchmark-bucket', CreateBucketConfiguration={'LocationConstraint': os.environ['AWS_DEFAULT_REGION']})
+            bench = scraper.Scraper(server_url, "Benchmark-Set", "BEN", True, 'cardlist.txt', True, "raw_data.zip", 'benchmark-bucket', "localhost", False, args.workers, args.engine)
+            bench.database_access = f"sqlite:///{os.path.join(work_dir, 'benchmark.db')}"
+            bench.rate_limiter = RateLimiter(rate=args.rate, max_rate=args.rate, burst=args.workers, jitter=0, target_latency=60)
+            bench.retry_backoff = args.retry_backoff
+            bench.download_workers = args.download_workers
+
+            samples = {stage: [] for stage in STAGES}
+            sampler = RssSampler()
+            for stage, method_name in STAGE_METHODS.items():
+                setattr(bench, method_name, _timed(getattr(bench, method_name), samples[stage], stage, sampler))
+
+            result = {'samples': samples}
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            sampler.start()
+            try:
+                with output:
+                    start = time.perf_counter()
+                    bench.run()
+                    result['scrape_seconds'] = time.perf_counter() - start
+                    result['pages'] = len(bench.journal.records())
+                    bench.save()
+                    bench.upload()
+            finally:
+                sampler.stop()
+            result['rss'] = {stage: sampler.peaks.get(stage) for stage in STAGES}
+            result['rss_growth'] = {stage: sampler.growth.get(stage) for stage in STAGES}
+            bench.close()
+        return result
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def summarise(results) -> dict:
+    """
+    Combines the results of every run into pages/sec and per-stage p50/p99 latency, peak RSS and RSS growth
+
+    Parameters
+    ----------
+    results : list[dict]
+        Results of run_once()
+    """
+    pages = sum(r['pages'] for r in results)
+    seconds = sum(r['scrape_seconds'] for r in results)
+    summary = {'runs': len(results), 'pages': pages, 'pages_per_sec': pages / seconds if seconds else 0.0, 'stages': {}}
+    for stage in STAGES:
+        samples = [s for r in results for s in r['samples'][stage]]
+        peaks = [r['rss'][stage] for r in results if r['rss'][stage] is not None]
+        growth = [r['rss_growth'][stage] for r in results if r['rss_growth'][stage] is not None]
+        summary['stages'][stage] = {
+            'calls': len(samples),
+            'p50_ms': _percentile(samples, 50) * 1000 if samples else None,
+            'p99_ms': _percentile(samples, 99) * 1000 if samples else None,
+            'mean_ms': statistics.fmean(samples) * 1000 if samples else None,
+            'peak_rss_mb': max(peaks) if peaks else None,
+            'rss_growth_mb': max(growth) if growth else None,
+        }
+    return summary
+
+def print_summary(summary) -> None:
+    """
+    Prints the summary as a table
+    """
+    print(f"{summary['pages']} pages in {summary['runs']} runs: {summary['pages_per_sec']:.1f} pages/sec")
+    print(f"{'stage':<18}{'calls':>7}{'p50 ms':>11}{'p99 ms':>11}{'peak RSS MB':>14}{'RSS growth MB':>16}")
+    for stage, stats in summary['stages'].items():
+        p50 = f"{stats['p50_ms']:.2f}" if stats['p50_ms'] is not None else '-'
+        p99 = f"{stats['p99_ms']:.2f}" if stats['p99_ms'] is not None else '-'
+        peak = f"{stats['peak_rss_mb']:.1f}" if stats['peak_rss_mb'] is not None else '-'
+        growth = f"{stats['rss_growth_mb']:.1f}" if stats['rss_growth_mb'] is not None else '-'
+        print(f"{stage:<18}{stats['calls']:>7}{p50:>11}{p99:>11}{peak:>14}{growth:>16}")
+
+def compare(summary, baseline, tolerance) -> list:
+    """
+    Returns a description of every metric that is worse than the baseline by more than tolerance
+
+    Parameters
+    ----------
+    summary : dict
+        Summary of this benchmark
+    baseline : dict
+        Summary of an earlier benchmark
+    tolerance : float
+        Allowed fractional regression e.g. 0.2 for 20%
+    """
+    regressions = []
+    if summary['pages_per_sec'] < baseline['pages_per_sec'] * (1 - tolerance):
+        regressions.append(f"pages/sec {summary['pages_per_sec']:.1f} < {baseline['pages_per_sec']:.1f}")
+    for stage, stats in summary['stages'].items():
+        base = baseline['stages'].get(stage)
+        if base is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms', 'peak_rss_mb'):
+            if stats[metric] is not None and base.get(metric) is not None and stats[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{stage} {metric} {stats[metric]:.2f} > {base[metric]:.2f}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scraper against a local fixture site with moto S3 and SQLite RDS stand-ins")
+    parser.add_argument("--cards", type=int, default=100, help="Number of synthetic product pages to serve")
+    parser.add_argument("--pages-dir", default=None, help="Directory of recorded product pages saved as <url slug>.html, used instead of synthetic pages")
+    parser.add_argument("--runs", type=int, default=3, help="Number of cold runs")
+    parser.add_argument("--workers", type=int, default=4, help="Scraper worker_count")
+    parser.add_argument("--engine", choices=("http", "selenium"), default="http")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Requests per second allowed by the rate limiter")
+    parser.add_argument("--download-workers", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of page requests dropped without a response")
+    parser.add_argument("--not-found-rate", type=float, default=0.0, help="Fraction of cards answered with 404")
+    parser.add_argument("--retry-backoff", type=float, default=0.1, help="Scraper retry_backoff in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the summary to this json file")
+    parser.add_argument("--baseline", default=None, help="Summary json of an earlier benchmark to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed fractional regression against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show the scraper's output")
+    args = parser.parse_args()
+
+    #moto needs credentials and a region to exist, they are never sent anywhere
+    for key, value in (('AWS_ACCESS_KEY_ID', 'benchmark'), ('AWS_SECRET_ACCESS_KEY', 'benchmark'), ('AWS_DEFAULT_REGION', 'eu-west-2')):
+        os.environ.setdefault(key, value)
+
+    pages = recorded_pages(args.pages_dir) if args.pages_dir else synthetic_pages(args.cards, args.seed)
+    server = FixtureServer(pages, args.latency, args.jitter, args.error_rate, args.not_found_rate, seed=args.seed)
+    server_url = server.start()
+    try:
+        results = [run_once(server_url, list(pages), args) for i in range(args.runs)]
+    finally:
+        server.stop()
+
+    summary = summarise(results)
+    print_summary(summary)
+    print(f"Fixture served {server.requests} requests, dropped {server.dropped}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(summary, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,157 @@
+from urllib.parse import urljoin
+
+#Declarative extraction of a cardmarket product page, shared by the Selenium and http engines
+#Both engines reduce a page to the same rows of {label, text, title, link} which FIELD_SPEC maps onto MTGCardData
+
+TABLE_XPATH = '//dl[@class="labeled row no-gutters mx-auto"]'
+IMAGE_XPATH = '//img[@class="is-front"]'
+
+#Collects the data table, title and image in one WebDriver round trip
+EXTRACT_SCRIPT = """
+const dl = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!dl) { return null; }
+const rows = [];
+for (const dt of dl.querySelectorAll('dt')) {
+    let dd = dt.nextElementSibling;
+    while (dd && dd.tagName !== 'DD') { dd = dd.nextElementSibling; }
+    const span = dd ? dd.querySelector('span') : null;
+    const link = dd ? dd.querySelector('a') : null;
+    rows.push({
+        label: dt.innerText.trim(),
+        text: dd ? dd.innerText.trim() : '',
+        title: span ? (span.getAttribute('data-original-title') || span.getAttribute('title')) : null,
+        link: link ? link.innerText.trim() : null,
+    });
+}
+const h1 = document.querySelector('h1');
+const image = document.evaluate(arguments[1], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+return {
+    rows: rows,
+    title: h1 ? h1.innerText.split('\\n')[0].trim() : null,
+    image: image ? image.src : null,
+};
+"""
+
+def parse_price(row) -> float:
+    """
+    Clips €/£ from the end of a cardmarket price e.g. "1,25 €" or "1.234,50 €" and converts it to floating point
+    """
+    price_str = row['text']
+    price_str = price_str.replace('.', '')  #Thousands separator
+    price_str = price_str.replace(',', '.')
+    price_str = price_str.replace(' ', '')
+    price_str = price_str.replace('€', '')
+    price_str = price_str.replace('£', '')
+    return float(price_str)
+
+def parse_int(row) -> int:
+    """
+    Converts a whole number row e.g. "Available items" to an int
+    """
+    return int(row['text'])
+
+def parse_rarity(row) -> str:
+    """
+    Returns the rarity, which is only given in the tooltip of the rarity symbol
+    """
+    return row['title']
+
+def parse_reprints(row) -> int:
+    """
+    Returns the number of versions of the card from the reprints link e.g. "Show Reprints (3)"
+    """
+    number_str = row['link'] or ''
+    if(number_str.find('(') == -1):
+        return 1    #If no number in parentheses found then there is only one version of that card on cardmarket
+    return int(number_str[number_str.find('(') + 1 : number_str.find(')')])
+
+#Label of each row in the data table -> (MTGCardData key, parser), rows with a key of None are expected but not stored
+FIELD_SPEC = {
+    "Rarity": ("rarity", parse_rarity),
+    "Reprints": ("version_count", parse_reprints),
+    "Printed in": (None, None),
+    "Available items": ("available_count", parse_int),
+    "Number": ("set_number", parse_int),
+    "From": ("lowest_price", parse_price),
+    "Price Trend": ("price_trend", parse_price),
+    "30-days average price": ("average_price_30_day", parse_price),
+    "7-days average price": ("average_price_7_day", parse_price),
+    "1-day average price": ("average_price_1_day", parse_price),
+}
+
+def extract_from_driver(driver) -> dict:
+    """
+    Runs EXTRACT_SCRIPT in the driver's current page, returning None if the data table isn't there
+
+    Parameters
+    ----------
+    driver : webdriver
+        Driver with a product page loaded
+    """
+    return driver.execute_script(EXTRACT_SCRIPT, TABLE_XPATH, IMAGE_XPATH)
+
+def extract_from_html(tree, base_url) -> dict:
+    """
+    Builds the same result as EXTRACT_SCRIPT from a served page parsed with lxml, returning None if the data table isn't there
+
+    Parameters
+    ----------
+    tree : lxml.html.HtmlElement
+        The parsed page
+    base_url : str
+        URL of the page, relative image urls are resolved against it
+    """
+    table = tree.xpath(TABLE_XPATH)
+    if not table:
+        return None
+    rows = []
+    for dt in table[0].xpath('.//dt'):
+        dd = dt.xpath('./following-sibling::dd[1]')
+        dd = dd[0] if dd else None
+        span = dd.xpath('.//span') if dd is not None else []
+        link = dd.xpath('.//a') if dd is not None else []
+        rows.append({
+            'label': dt.text_content().strip(),
+            'text': dd.text_content().strip() if dd is not None else '',
+            'title': (span[0].get('data-original-title') or span[0].get('title')) if span else None,
+            'link': link[0].text_content().strip() if link else None,
+        })
+
+    #The card name is the h1's own text, the set name follows it in a nested element
+    h1 = tree.xpath('//h1')
+    image = tree.xpath(IMAGE_XPATH + '/@src')
+    return {
+        'rows': rows,
+        'title': (h1[0].text or h1[0].text_content()).strip() if h1 else None,
+        'image': urljoin(base_url, image[0]) if image else None,
+    }
+
+def fill_record(scraped_data, extracted, debug=False) -> None:
+    """
+    Maps an extraction result onto a record through FIELD_SPEC
+
+    Parameters
+    ----------
+    scraped_data : MTGCardData
+        Record to fill in
+    extracted : dict
+        Result of extract_from_driver or extract_from_html
+    debug : bool
+        Whether to print each field as it is read
+    """
+    for row in extracted['rows']:
+        if row['label'] not in FIELD_SPEC:
+            print("Unexpected input: " + row['label'])
+            continue
+        key, parser = FIELD_SPEC[row['label']]
+        if key is None:
+            continue
+        setattr(scraped_data, key, parser(row))
+        if(debug):
+            print(f"{row['label']} -> {getattr(scraped_data, key)}")
+
+    scraped_data.card_name = extracted['title']
+    scraped_data.image_url = extracted['image']
+    if(debug):
+        print("NAME -> " + str(extracted['title']))
+        print("Card url: " + str(extracted['image']))
@@ -0,0 +1,209 @@
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+#Content-addressed image storage shared by every set, so artwork reused by reprints is stored and uploaded once
+#<root>/objects/ab/abcd...jpg holds the downloaded bytes, <root>/variants/ab/abcd.../<variant>.webp the derived images
+
+#Variant name -> bounding box in pixels, None keeps the full size
+VARIANTS = {
+    "thumb": (146, 204),
+    "medium": (488, 680),
+    "full": None,
+}
+WEBP_QUALITY = 80
+
+def file_hash(file_path) -> str:
+    """
+    Returns the sha256 of a file, read in chunks
+
+    Parameters
+    ----------
+    file_path : str
+        Path of the file to hash
+    """
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def make_variants(source_path, variant_dir, variants=VARIANTS, quality=WEBP_QUALITY) -> dict:
+    """
+    Writes a WebP of an image for every variant, run in a worker process
+
+    Parameters
+    ----------
+    source_path : str
+        Path of the original image
+    variant_dir : str
+        Directory to write <variant>.webp files to
+    variants : dict
+        Variant name -> bounding box, None keeps the full size
+    quality : int
+        WebP quality from 0 to 100
+
+    Returns
+    -------
+    dict
+        Variant name -> path of the written file
+    """
+    os.makedirs(variant_dir, exist_ok=True)
+    paths = {}
+    with Image.open(source_path) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for name, size in variants.items():
+            variant = image.copy()
+            if size is not None:
+                variant.thumbnail(size, Image.LANCZOS)
+            path = os.path.join(variant_dir, f'{name}.webp')
+            with tempfile.NamedTemporaryFile('wb', dir=variant_dir, delete=False) as out_file:
+                variant.save(out_file, format='WEBP', quality=quality, method=4)
+            os.replace(out_file.name, path)
+            paths[name] = path
+    return paths
+
+class ImageStore:
+    """
+    Stores each distinct image once under its sha256 and links the per-set filenames to it
+
+    Parameters
+    ----------
+    root_dir : str
+        Directory of the store
+    workers : int
+        Processes generating variants, defaults to the number of cores
+    variants : dict
+        Variant name -> bounding box, None keeps the full size
+
+    Attributes
+    ----------
+    root_dir : str
+        Directory of the store
+    workers : int
+        Processes generating variants
+    variants : dict
+        Variant name -> bounding box of the WebP variants made of every image
+    quality : int
+        WebP quality of the variants
+    """
+
+    def __init__(self, root_dir, workers=None, variants=VARIANTS) -> None:
+        self.root_dir = root_dir
+        self.workers = workers
+        self.variants = variants
+        self.quality = WEBP_QUALITY
+
+    def object_path(self, sha, extension) -> str:
+        """
+        Returns where the original bytes of an image are stored e.g. <root>/objects/ab/abcd...jpg
+        """
+        return os.path.join(self.root_dir, 'objects', sha[:2], sha + extension)
+
+    def variant_dir(self, sha) -> str:
+        """
+        Returns the directory the variants of an image are stored in e.g. <root>/variants/ab/abcd...
+        """
+        return os.path.join(self.root_dir, 'variants', sha[:2], sha)
+
+    def variant_paths(self, sha) -> dict:
+        """
+        Returns variant name -> path of every variant of an image
+        """
+        return {name: os.path.join(self.variant_dir(sha), f'{name}.webp') for name in self.variants}
+
+    @staticmethod
+    def _link(object_path, file_path) -> None:
+        """
+        Points file_path at a stored object with a relative symlink, falling back to a hard link and then a copy where symlinks aren't allowed
+        """
+        try:
+            os.symlink(os.path.relpath(object_path, os.path.dirname(file_path)), file_path)
+        except OSError:
+            try:
+                os.link(object_path, file_path)
+            except OSError:
+                shutil.copyfile(object_path, file_path)
+
+    def ingest(self, file_path) -> str:
+        """
+        Moves a downloaded image into the store, or drops it if the store already holds the same bytes, and links file_path to the stored copy
+
+        Files that are already links into the store are not re-hashed
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the downloaded image
+
+        Returns
+        -------
+        str
+            Path of the stored object
+        """
+        if os.path.islink(file_path):
+            target = os.path.realpath(file_path)
+            if os.path.isfile(target):
+                return target
+            os.remove(file_path)    #Dangling link, the image has to be downloaded again
+            raise FileNotFoundError(f"{file_path} points to missing {target}")
+
+        object_path = self.object_path(file_hash(file_path), os.path.splitext(file_path)[1].lower())
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        if os.path.isfile(object_path):
+            os.remove(file_path)
+        else:
+            os.replace(file_path, object_path)
+        self._link(object_path, file_path)
+        return object_path
+
+    def process(self, file_paths) -> dict:
+        """
+        Ingests images and generates the variants of any stored object that doesn't have them yet in a process pool
+
+        Parameters
+        ----------
+        file_paths : list[str]
+            Paths of downloaded images
+
+        Returns
+        -------
+        dict
+            file path -> {sha256, object, variants} of every image that could be stored, variants is empty if they could not be made
+        """
+        entries = {}
+        pending = {}
+        for file_path in file_paths:
+            try:
+                object_path = self.ingest(file_path)
+            except OSError as err:
+                print(f"Could not store {file_path}: {err=}, {type(err)=}")
+                continue
+            sha = os.path.splitext(os.path.basename(object_path))[0]
+            variants = self.variant_paths(sha)
+            entries[file_path] = {'sha256': sha, 'object': object_path, 'variants': variants}
+            if not all(os.path.isfile(path) for path in variants.values()):
+                pending[sha] = object_path
+
+        if pending:
+            #Spawned workers don't inherit the scraper's threads, sessions and held locks the way forked ones would
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                futures = {executor.submit(make_variants, object_path, self.variant_dir(sha), self.variants, self.quality): sha
+                           for sha, object_path in pending.items()}
+                for future in as_completed(futures):
+                    sha = futures[future]
+                    try:
+                        future.result()
+                    except Exception as err:
+                        print(f"Could not make variants of {pending[sha]}: {err=}, {type(err)=}")
+                        for entry in entries.values():
+                            if entry['sha256'] == sha:
+                                entry['variants'] = {}
+        return entries
@@ -1,28 +1,152 @@
 import json
+import os
 import string
+import sys
+import ijson
 
-#Convert a card set from mtgjson.com to a .txt containing the nanme of each individual card in the set
+#Convert card sets from mtgjson.com to .txt files containing the name of each individual card in the set
 
-#Load json data
-with open("NEO.json", 'r') as f:
-    neo_data = json.load(f)
-f.close()
+#Cardmarket expansion names that don't follow from the mtgjson set name
+SET_SLUG_OVERRIDES = {
+    "LEA": "Alpha",
+    "LEB": "Beta",
+    "2ED": "Unlimited",
+    "3ED": "Revised",
+}
 
-#Get number of cards in json
-set_size = neo_data["data"]["totalSetSize"]
-name_list = []
+#Card fields kept for building urls
+CARD_FIELDS = ("name", "number", "faceName")
 
-#Get each name
-for i in range(set_size):
-    name_list.append(neo_data["data"]["cards"][i]["name"])
+def set_slug(set_code, set_name) -> str:
+    """
+    Converts an mtgjson set name to the form it takes in cardmarket's urls e.g. Kamigawa: Neon Dynasty -> Kamigawa-Neon-Dynasty
 
-#Remove duplicates and sort
-name_list =  set(name_list)
-name_list = sorted(name_list)
+    Parameters
+    ----------
+    set_code : str
+        MTG three letter expansion code of the set
+    set_name : str
+        Name of the set on mtgjson
+    """
+    if set_code in SET_SLUG_OVERRIDES:
+        return SET_SLUG_OVERRIDES[set_code]
+    slug = set_name.translate({ord(c):None for c in "',:.&"}) #Remove punctuation cardmarket leaves out
+    return '-'.join(slug.split())  #Replace runs of spaces with single hyphens
 
-#Write to txt
-cardlist_txt = open('cardlist.txt', 'w')
+def _set_info(state) -> dict:
+    """
+    Builds the output of a finished set from its parse state
+    """
+    return {
+        "name": state["name"],
+        "slug": set_slug(state["code"], state["name"]),
+        "cards": sorted(state["cards"]),
+        "details": state["cards"],
+    }
 
-for name in name_list:
-    cardlist_txt.write(name + '\n')
-cardlist_txt.close()
\ No newline at end of file
+def iter_sets(filepath, set_codes=None):
+    """
+    Streams a single set file or AllPrintings.json from mtgjson, yielding each set as soon as its closing brace is read
+
+    Only the fields in CARD_FIELDS are kept, so memory is bounded by the deduplicated cards of one set rather than the file size
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the mtgjson file
+    set_codes : list[str]
+        Codes of the sets to yield, every set in the file if None
+
+    Yields
+    ------
+    tuple
+        Set code and a dict with the set's name, cardmarket url slug, sorted card names and
+        details mapping each card name to its collector number and face names
+    """
+    states = {}     #Parse state of each open set, keyed by its prefix: "data" for a set file, "data.<code>" in AllPrintings
+    card = {}
+    with open(filepath, 'rb') as f:
+        for prefix, event, value in ijson.parse(f):
+            if not prefix.startswith('data'):
+                continue
+
+            if '.cards.item' in prefix:
+                root, field = prefix.split('.cards.item', 1)
+                if root.count('.') > 1:
+                    continue
+                if root not in states:
+                    #The first card of a set, AllPrintings sets that weren't requested are skipped entirely
+                    code = root.partition('.')[2] or None
+                    if code is not None and set_codes is not None and code not in set_codes:
+                        continue
+                    states[root] = {"code": code, "name": code, "cards": {}}
+                field = field.lstrip('.')
+                if event == 'end_map' and field == '':
+                    name = card.get("name")
+                    if name:
+                        details = states[root]["cards"].setdefault(name, {"number": card.get("number"), "face_names": []})
+                        face_name = card.get("faceName")
+                        if face_name and face_name not in details["face_names"]:
+                            details["face_names"].append(face_name)
+                    card = {}
+                elif field in CARD_FIELDS and event == 'string':
+                    card[field] = value
+                continue
+
+            #mtgjson sorts keys so a set's code and name come after its cards
+            root, _, field = prefix.rpartition('.')
+            if root in states and field in ("code", "name") and event == 'string':
+                states[root][field] = value
+            elif event == 'end_map' and prefix in states:
+                state = states.pop(prefix)
+                if state["cards"] and (set_codes is None or state["code"] in set_codes):
+                    yield state["code"], _set_info(state)
+
+def load_sets(filepath, set_codes=None) -> dict:
+    """
+    Loads every requested set of an mtgjson file into a dict keyed by set code, see iter_sets
+    """
+    return dict(iter_sets(filepath, set_codes))
+
+def write_cardlist(names, filepath) -> None:
+    """
+    Writes one card name per line to a target list
+
+    Parameters
+    ----------
+    names : list[str]
+        Card names to write
+    filepath : str
+        Path of the target list
+    """
+    if os.path.dirname(filepath):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, 'w') as cardlist_txt:
+        for name in names:
+            cardlist_txt.write(name + '\n')
+
+def write_card_details(details, filepath) -> None:
+    """
+    Writes the collector number and face names of each card to a json file next to its target list
+
+    Parameters
+    ----------
+    details : dict
+        Maps card name to its collector number and face names
+    filepath : str
+        Path of the json file
+    """
+    if os.path.dirname(filepath):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, 'w') as f:
+        json.dump(details, f)
+
+if __name__ == "__main__":
+    #Usage: python json_parser.py [mtgjson file] [output directory]
+    mtgjson_filepath = sys.argv[1] if len(sys.argv) > 1 else "NEO.json"
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else "."
+
+    #Stream the json, writing each set's deduplicated, sorted names to <SET>_cardlist.txt as soon as it is read
+    for code, set_info in iter_sets(mtgjson_filepath):
+        write_cardlist(set_info["cards"], os.path.join(output_dir, f'{code}_cardlist.txt'))
+        write_card_details(set_info["details"], os.path.join(output_dir, f'{code}_cards.json'))
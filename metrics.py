@@ -0,0 +1,239 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#Upper bounds in seconds of the stage timing histogram buckets, from a fast JSON write up to a slow page load or upload
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _label_text(labels) -> str:
+    """
+    Formats sorted (name, value) label pairs as a Prometheus label set e.g. {stage="zip"}
+    """
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+class Metrics:
+    """
+    Thread-safe registry of counters and timing histograms, exported in Prometheus text format, with structured JSON logging
+
+    Parameters
+    ----------
+    log_filepath : str
+        JSON lines file log() appends events to, logging is off if None
+    buckets : tuple[float]
+        Upper bounds of the timing histogram buckets in seconds
+    max_log_bytes : int
+        Size at which the log file is moved to <log_filepath>.1, replacing the previous one, and a new log started. Never rotated if None
+
+    Attributes
+    ----------
+    counters : dict
+        (name, labels) -> value
+    histograms : dict
+        (name, labels) -> [bucket counts, sum, count]
+    help : dict
+        Metric name -> (type, help text)
+    lock : threading.Lock
+        Guards the metrics and the log file
+    server : ThreadingHTTPServer
+        Server started by serve(), None if the metrics are not being served
+    """
+
+    def __init__(self, log_filepath=None, buckets=DEFAULT_BUCKETS, max_log_bytes=64 * 1024 * 1024) -> None:
+        self.log_filepath = log_filepath
+        self.max_log_bytes = max_log_bytes
+        self.buckets = tuple(buckets)
+        self.counters = {}
+        self.histograms = {}
+        self.help = {
+            'mtgscraper_stage_seconds': ('histogram', 'Wall time of each instrumented stage of the scraper'),
+        }
+        self.lock = threading.Lock()
+        self.server = None
+
+    def describe(self, name, metric_type, help_text) -> None:
+        """
+        Sets the type and help text a metric is exported with
+
+        Parameters
+        ----------
+        name : str
+            Name of the metric
+        metric_type : str
+            counter or histogram
+        help_text : str
+            Description of the metric
+        """
+        with self.lock:
+            self.help[name] = (metric_type, help_text)
+
+    def increment(self, name, value=1, **labels) -> None:
+        """
+        Adds value to a counter
+
+        Parameters
+        ----------
+        name : str
+            Name of the counter, ending in _total
+        value : float
+            Amount to add
+        **labels
+            Labels of the series
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels) -> None:
+        """
+        Adds an observation to a histogram
+
+        Parameters
+        ----------
+        name : str
+            Name of the histogram
+        seconds : float
+            The observed value
+        **labels
+            Labels of the series
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """
+        Times the body of a with block into mtgscraper_stage_seconds, also when it raises
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage e.g. geturl or zip
+        **labels
+            Extra labels of the series e.g. set_code
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('mtgscraper_stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    def log(self, event, **fields) -> None:
+        """
+        Appends one JSON object with a timestamp, the event name and the given fields to the log file, rotating it once it reaches max_log_bytes
+
+        Parameters
+        ----------
+        event : str
+            Name of the event e.g. page_scraped
+        **fields
+            Values to log with the event, anything not JSON serialisable is logged as its str
+        """
+        if self.log_filepath is None:
+            return
+        line = json.dumps({'ts': time.time(), 'event': event, **fields}, default=str)
+        with self.lock:
+            os.makedirs(os.path.dirname(self.log_filepath) or '.', exist_ok=True)
+            if self.max_log_bytes is not None and os.path.isfile(self.log_filepath) and os.path.getsize(self.log_filepath) >= self.max_log_bytes:
+                os.replace(self.log_filepath, self.log_filepath + '.1')
+            with open(self.log_filepath, 'a') as f:
+                f.write(line + '\n')
+
+    def stage_totals(self) -> dict:
+        """
+        Returns the total seconds spent in each stage, summed over its other labels, slowest first
+        """
+        totals = {}
+        with self.lock:
+            for (name, labels), (bucket_counts, total, count) in self.histograms.items():
+                if name == 'mtgscraper_stage_seconds':
+                    stage = dict(labels)['stage']
+                    totals[stage] = totals.get(stage, 0.0) + total
+        return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+    def to_prometheus(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            series = {}
+            for (name, labels), value in self.counters.items():
+                series.setdefault(name, []).append(f'{name}{_label_text(labels)} {value}')
+            for (name, labels), (bucket_counts, total, count) in self.histograms.items():
+                rows = series.setdefault(name, [])
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    rows.append(f'{name}_bucket{_label_text(labels + (("le", bound),))} {bucket_count}')
+                rows.append(f'{name}_bucket{_label_text(labels + (("le", "+Inf"),))} {count}')
+                rows.append(f'{name}_sum{_label_text(labels)} {total}')
+                rows.append(f'{name}_count{_label_text(labels)} {count}')
+            for name in sorted(series):
+                metric_type, help_text = self.help.get(name, ('untyped', name))
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                lines.extend(series[name])
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, filepath) -> None:
+        """
+        Atomically writes the metrics to a file, e.g. for node exporter's textfile collector
+
+        Parameters
+        ----------
+        filepath : str
+            Path of the file to write
+        """
+        content = self.to_prometheus()
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(filepath)), delete=False) as f:
+            f.write(content)
+        os.replace(f.name, filepath)
+
+    def serve(self, port, address='') -> None:
+        """
+        Serves the metrics at /metrics from a background thread for Prometheus to scrape
+
+        Parameters
+        ----------
+        port : int
+            Port to listen on
+        address : str
+            Address to bind, all interfaces if empty
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
@@ -1,21 +1,91 @@
-import string
-from uuid import UUID, uuid4
-
 class MTGCardData:
+    """
+    Record of one scraped card
+
+    Fields are slots declared by SCHEMA rather than keys of a per-record dict, unset fields are None and are written out as null
+
+    Attributes
+    ----------
+    SCHEMA : tuple
+        (field name, type, required) of every field, in output column order
+    FIELDS : tuple[str]
+        Field names in output column order
+    """
+
+    SCHEMA = (
+        ("card_name", str, True),
+        ("rarity", str, False),
+        ("available_count", int, False),
+        ("version_count", int, False),
+        ("set_number", int, True), #unique ID
+        ("lowest_price", float, False),
+        ("price_trend", float, False),
+        ("average_price_30_day", float, False),
+        ("average_price_7_day", float, False),
+        ("average_price_1_day", float, False),
+        ("image_url", str, True),
+        ("image_key", str, True),
+        ("uuid", str, True),
+    )
+    FIELDS = tuple(name for name, field_type, required in SCHEMA)
+    __slots__ = FIELDS
+
+    def __init__(self, **fields) -> None:
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+
+    def validate(self) -> None:
+        """
+        Checks every field against SCHEMA, converting whole number prices to float
+
+        Raises
+        ------
+        ValueError
+            If a required field is None or a field has the wrong type
+        """
+        for name, field_type, required in self.SCHEMA:
+            value = getattr(self, name)
+            if value is None:
+                if required:
+                    raise ValueError(f"{name} is required")
+                continue
+            if field_type is float and isinstance(value, int) and not isinstance(value, bool):
+                setattr(self, name, float(value))
+            elif not isinstance(value, field_type) or isinstance(value, bool):
+                raise ValueError(f"{name} should be {field_type.__name__}, got {value!r}")
+
+    def to_dict(self) -> dict:
+        """
+        Returns the record as a dict in FIELDS order, for json output
+        """
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def to_tuple(self) -> tuple:
+        """
+        Returns the record's values in FIELDS order, for DataFrame and SQL rows
+        """
+        return tuple(getattr(self, name) for name in self.FIELDS)
+
+    @classmethod
+    def from_dict(cls, record) -> "MTGCardData":
+        """
+        Builds a record from a dict such as a saved json record, ignoring unknown keys
+
+        Parameters
+        ----------
+        record : dict
+            The record to convert
+        """
+        return cls(**{name: record.get(name) for name in cls.FIELDS})
+
+    @classmethod
+    def to_columns(cls, records) -> dict:
+        """
+        Converts records to one list per field, e.g. for pd.DataFrame(MTGCardData.to_columns(records))
 
-    def __init__(self) -> None:
-        self.dict = {
-        "card_name": string,
-        "rarity": string,
-        "available_count": int,
-        "version_count": int,
-        "set_number": int, #unique ID
-        "lowest_price": float,
-        "price_trend": float,
-        "average_price_30_day": float,
-        "average_price_7_day": float,
-        "average_price_1_day": float,
-        "image_url" : string,
-        "image_key" : string,
-        "uuid": string,}
-    
\ No newline at end of file
+        Parameters
+        ----------
+        records : list[MTGCardData]
+            The records to convert
+        """
+        return {name: [getattr(record, name) for record in records] for name in cls.FIELDS}
@@ -0,0 +1,183 @@
+import argparse
+import os
+import queue
+import threading
+
+import json_parser
+from scraper import Scraper, shared_metrics
+
+class Orchestrator:
+    """
+    Scrapes many sets from one mtgjson file through a shared pool of scrapers
+
+    Each scraper keeps its browser session and cookies between sets and takes the next set from a shared queue when it finishes one
+
+    Parameters
+    ----------
+    mtgjson_filepath : str
+        Path of a single set file or AllPrintings.json from mtgjson
+    set_codes : list[str]
+        Codes of the sets to scrape, or ["all"] for every set in the file
+    scraper_count : int
+        Number of scrapers, and so browser sessions, working through the sets concurrently
+    target_url : str
+        URL of the website to scrape from
+    local_target_list : bool
+        Whether or not to use the local manifest or check for missing cards serverside to scrape
+    to_upload : bool
+        Whether or not to upload each set after scraping
+    upload_file_name : str
+        The name of the file to upload to s3
+    bucket_name : str
+        Name of the s3 bucket to upload to
+    rds_endpoint : str
+        URL of the endpoint of the RDS instance to upload to
+    debug : bool
+        Whether or not to enable debugging
+    engine : str
+        Engine each scraper uses, "selenium" or "http"
+    cardlist_dir : str
+        Directory the target list of each set is written to
+    use_queue : bool
+        Whether to put the cards of every set on the work queue in the RDS database and scrape from it, so several machines can share the sets
+    replay : bool
+        Whether to re-extract every set from its archived page snapshots instead of scraping it
+    refresh : bool
+        Whether to only scrape the cards of each set that the refresh scheduler finds due, instead of only the unscraped ones
+    refresh_budget : int
+        Maximum number of cards scraped per set when refreshing, unlimited if None
+
+    Attributes
+    ----------
+    failed_sets : list[str]
+        Codes of the sets that could not be scraped, saved or uploaded
+    """
+
+    def __init__(self, mtgjson_filepath, set_codes, scraper_count, target_url, local_target_list, to_upload, upload_file_name, bucket_name, rds_endpoint, debug, engine="selenium", cardlist_dir="cardlists", use_queue=False, replay=False, refresh=False, refresh_budget=None) -> None:
+        self.mtgjson_filepath = mtgjson_filepath
+        self.set_codes = None if "all" in set_codes else set(set_codes)
+        self.scraper_count = max(1, scraper_count)
+        self.target_url = target_url
+        self.local_target_list = local_target_list
+        self.to_upload = to_upload
+        self.upload_file_name = upload_file_name
+        self.bucket_name = bucket_name
+        self.rds_endpoint = rds_endpoint
+        self.debug = debug
+        self.engine = engine
+        self.cardlist_dir = cardlist_dir
+        self.use_queue = use_queue
+        self.replay = replay
+        self.refresh = refresh
+        self.refresh_budget = refresh_budget
+        self.failed_sets = []
+        self.failed_lock = threading.Lock()
+
+    def _write_targets(self) -> list:
+        """
+        Streams the mtgjson file, writing the target list and card details of every requested set as it is read, and returns (set_code, set_slug, target_list_filepath) for each
+        """
+        targets = []
+        for code, set_info in json_parser.iter_sets(self.mtgjson_filepath, self.set_codes):
+            target_list_filepath = os.path.join(self.cardlist_dir, f'{code}_cardlist.txt')
+            json_parser.write_cardlist(set_info["cards"], target_list_filepath)
+            json_parser.write_card_details(set_info["details"], os.path.join(self.cardlist_dir, f'{code}_cards.json'))
+            targets.append((code, set_info["slug"], target_list_filepath))
+        return targets
+
+    def run(self) -> None:
+        """
+        Scrapes every requested set, each scraper taking sets from a shared queue until none are left
+        """
+        set_queue = queue.Queue()
+        for target in self._write_targets():
+            set_queue.put(target)
+        print(f'Scraping {set_queue.qsize()} sets with {self.scraper_count} scrapers')
+
+        threads = [threading.Thread(target=self._worker, args=(set_queue,)) for _ in range(min(self.scraper_count, set_queue.qsize()))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if self.failed_sets:
+            print('Failed sets: ' + ', '.join(self.failed_sets))
+
+    def _worker(self, set_queue) -> None:
+        """
+        Scrapes sets from the queue with one scraper, created for the first set and retargeted for each one after it
+
+        With use_queue set the scraper instead adds the cards of each set to the work queue, then scrapes from the work queue until it is empty
+
+        Parameters
+        ----------
+        set_queue : queue.Queue
+            Queue of (set_code, set_slug, target_list_filepath) tuples
+        """
+        scraper = None
+        try:
+            while True:
+                try:
+                    set_code, set_slug, target_list_filepath = set_queue.get_nowait()
+                except queue.Empty:
+                    break
+                print(f'Set {set_code} - {set_slug}')
+                try:
+                    if scraper is None:
+                        scraper = Scraper(self.target_url, set_slug, set_code, self.local_target_list, target_list_filepath, self.to_upload, self.upload_file_name, self.bucket_name, self.rds_endpoint, self.debug, engine=self.engine)
+                    else:
+                        scraper.retarget(set_slug, set_code, target_list_filepath)
+                    scraper.refresh_schedule = self.refresh
+                    scraper.refresh_budget = self.refresh_budget
+                    if self.use_queue:
+                        scraper.enqueue()
+                        continue
+                    if self.replay:
+                        scraper.replay()
+                    else:
+                        scraper.run()
+                    scraper.save()
+                    if self.to_upload:
+                        scraper.upload()
+                except BaseException as err:
+                    print(f"Could not process set {set_code}: {err=}, {type(err)=}")
+                    with self.failed_lock:
+                        self.failed_sets.append(set_code)
+
+            if self.use_queue and scraper is not None:
+                try:
+                    scraper.run_queue()
+                except BaseException as err:
+                    print(f"Could not work through the queue, stopped at set {scraper.set_code}: {err=}, {type(err)=}")
+                    with self.failed_lock:
+                        self.failed_sets.append(scraper.set_code)
+        finally:
+            if scraper is not None:
+                scraper.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape several sets listed in an mtgjson file")
+    parser.add_argument("mtgjson_filepath", help="mtgjson set file or AllPrintings.json")
+    parser.add_argument("set_codes", nargs="+", help='set codes to scrape, or "all"')
+    parser.add_argument("--scrapers", type=int, default=2, help="number of concurrent browser sessions")
+    parser.add_argument("--engine", choices=["selenium", "http"], default="selenium")
+    parser.add_argument("--upload", action="store_true", help="upload each set after scraping")
+    parser.add_argument("--debug", action="store_true")
+    parser.add_argument("--queue", action="store_true", help="share the cards through the work queue in RDS so several machines can scrape the same sets")
+    parser.add_argument("--replay", action="store_true", help="re-extract each set from its archived page snapshots without the network")
+    parser.add_argument("--refresh", action="store_true", help="rescrape the cards whose prices are likely to have changed, judged from their price history")
+    parser.add_argument("--refresh-budget", type=int, default=None, help="maximum number of cards refreshed per set")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics at /metrics on this port")
+    args = parser.parse_args()
+
+    if args.metrics_port is not None:
+        shared_metrics.serve(args.metrics_port)
+
+    target_url = "https://www.cardmarket.com"
+    upload_file_name = "raw_data.zip"
+    bucket_name = "mtgscraperbucket"
+    rds_endpoint = "testaidb.czu22ftu6upt.eu-west-2.rds.amazonaws.com"
+    local_target_list = False
+
+    orchestrator = Orchestrator(args.mtgjson_filepath, args.set_codes, args.scrapers, target_url, local_target_list, args.upload, upload_file_name, bucket_name, rds_endpoint, args.debug, args.engine, use_queue=args.queue, replay=args.replay, refresh=args.refresh, refresh_budget=args.refresh_budget)
+    orchestrator.run()
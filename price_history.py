@@ -0,0 +1,121 @@
+import datetime
+import os
+from uuid import uuid4
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from mtg_card_data import MTGCardData
+
+#Append-only Parquet dataset of every run's records, hive partitioned as <root>/set_code=NEO/scrape_date=2022-08-25/part-*.parquet
+
+_ARROW_TYPES = {str: pa.string(), int: pa.int64(), float: pa.float64()}
+
+#card_name and rarity repeat across every run so they are dictionary encoded
+_DICTIONARY_FIELDS = ("card_name", "rarity")
+
+RECORD_SCHEMA = pa.schema([
+    pa.field(name, pa.dictionary(pa.int32(), pa.string()) if name in _DICTIONARY_FIELDS else _ARROW_TYPES[field_type])
+    for name, field_type, required in MTGCardData.SCHEMA
+])
+
+PARTITIONING = ds.partitioning(pa.schema([("set_code", pa.string()), ("scrape_date", pa.date32())]), flavor="hive")
+
+def write_partition(records, root_dir, set_code, scrape_date=None) -> str:
+    """
+    Adds one run's records to the dataset as a new file in the set's partition for the scrape date
+
+    Parameters
+    ----------
+    records : list[dict]
+        Records of the run, as saved to data.json
+    root_dir : str
+        Root directory of the dataset
+    set_code : str
+        MTG three letter expansion code of the set
+    scrape_date : datetime.date
+        Date of the run, today if None
+
+    Returns
+    -------
+    str
+        Path of the written file, None if there were no records
+    """
+    if not records:
+        return None
+    scrape_date = scrape_date or datetime.date.today()
+    columns = MTGCardData.to_columns([MTGCardData.from_dict(record) for record in records])
+    table = pa.Table.from_pydict(columns, schema=RECORD_SCHEMA)
+
+    partition_dir = os.path.join(root_dir, f"set_code={set_code}", f"scrape_date={scrape_date.isoformat()}")
+    os.makedirs(partition_dir, exist_ok=True)
+    file_path = os.path.join(partition_dir, f"part-{datetime.datetime.now().strftime('%H%M%S')}-{uuid4().hex[:8]}.parquet")
+    pq.write_table(table, file_path)
+    return file_path
+
+def open_dataset(root_dir) -> ds.Dataset:
+    """
+    Opens the dataset with set_code and scrape_date as partition columns
+
+    Parameters
+    ----------
+    root_dir : str
+        Root directory of the dataset
+    """
+    return ds.dataset(root_dir, format="parquet", partitioning=PARTITIONING)
+
+def price_history(root_dir, card_name, set_code=None, columns=("scrape_date", "price_trend")) -> pa.Table:
+    """
+    Reads the history of one card, touching only the requested columns and, if set_code is given, that set's partitions
+
+    Parameters
+    ----------
+    root_dir : str
+        Root directory of the dataset
+    card_name : str
+        Name of the card
+    set_code : str
+        MTG three letter expansion code to restrict the read to
+    columns : tuple[str]
+        Columns to return
+
+    Returns
+    -------
+    pa.Table
+        The requested columns of every record of the card, sorted by scrape date
+    """
+    condition = ds.field("card_name") == card_name
+    if set_code is not None:
+        condition = condition & (ds.field("set_code") == set_code)
+    table = open_dataset(root_dir).to_table(columns=list(columns), filter=condition)
+    if "scrape_date" in table.column_names:
+        table = table.sort_by("scrape_date")
+    return table
+
+def set_history(root_dir, set_code, columns=("card_name", "scrape_date", "price_trend"), since=None) -> pa.Table:
+    """
+    Reads the history of every card of a set, touching only that set's partitions and, if since is given, the scrape dates from it on
+
+    Parameters
+    ----------
+    root_dir : str
+        Root directory of the dataset
+    set_code : str
+        MTG three letter expansion code of the set
+    columns : tuple[str]
+        Columns to return
+    since : datetime.date
+        Earliest scrape date to read
+
+    Returns
+    -------
+    pa.Table
+        The requested columns of every record of the set, empty if the dataset doesn't exist yet
+    """
+    if not os.path.isdir(root_dir):
+        return pa.table({name: [] for name in columns})
+    condition = ds.field("set_code") == set_code
+    if since is not None:
+        condition = condition & (ds.field("scrape_date") >= since)
+    return open_dataset(root_dir).to_table(columns=list(columns), filter=condition)
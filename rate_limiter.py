@@ -0,0 +1,133 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+class RateLimiter:
+    """
+    Adaptive token bucket per host, shared by every worker and engine so the site sees one polite client
+
+    The rate of a host grows additively while its pages load quickly and is cut multiplicatively on slow pages, errors and throttling responses.
+    429/503 responses also pause the host for their Retry-After time
+
+    Parameters
+    ----------
+    rate : float
+        Starting requests per second for each host
+    min_rate : float
+        Lowest requests per second a host is slowed down to
+    max_rate : float
+        Highest requests per second a host is sped up to
+    burst : float
+        Number of requests a host may make back to back after idling
+    jitter : float
+        Random extra wait as a fraction of the current request interval, so workers don't fire in lockstep
+    target_latency : float
+        Page load time in seconds above which a host is treated as under strain
+
+    Attributes
+    ----------
+    hosts : dict
+        Rate, tokens, last refill time and blocked-until time of each host
+    lock : threading.Lock
+        Guards hosts
+    """
+
+    def __init__(self, rate=0.5, min_rate=0.05, max_rate=5.0, burst=1.0, jitter=0.25, target_latency=2.0) -> None:
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.jitter = jitter
+        self.target_latency = target_latency
+        self.increase = 0.05
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def _host(self, url) -> dict:
+        """
+        Returns the state of the host of a url, creating it on first use, called with lock held
+        """
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = {'rate': self.rate, 'tokens': self.burst, 'last': time.monotonic(), 'blocked_until': 0.0}
+        return self.hosts[host]
+
+    def acquire(self, url) -> None:
+        """
+        Blocks until a request to the host of url is allowed
+
+        Parameters
+        ----------
+        url : str
+            URL about to be requested
+        """
+        while True:
+            with self.lock:
+                state = self._host(url)
+                now = time.monotonic()
+                state['tokens'] = min(self.burst, state['tokens'] + (now - state['last']) * state['rate'])
+                state['last'] = now
+                if now < state['blocked_until']:
+                    wait = state['blocked_until'] - now
+                elif state['tokens'] >= 1:
+                    state['tokens'] -= 1
+                    wait = 0
+                else:
+                    wait = (1 - state['tokens']) / state['rate']
+                interval = 1 / state['rate']
+            if wait == 0:
+                time.sleep(random.uniform(0, self.jitter * interval))
+                return
+            time.sleep(wait)
+
+    @staticmethod
+    def _parse_retry_after(retry_after) -> float:
+        """
+        Converts a Retry-After header, in seconds or as an HTTP date, to seconds from now
+        """
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def record(self, url, latency, status=200, retry_after=None) -> None:
+        """
+        Adapts the rate of a host to the outcome of a request
+
+        Parameters
+        ----------
+        url : str
+            URL that was requested
+        latency : float
+            Seconds the request took
+        status : int
+            HTTP status of the response, None if the request failed without one
+        retry_after : str
+            Retry-After header of the response, if any
+        """
+        with self.lock:
+            state = self._host(url)
+            if status in (429, 503):
+                state['rate'] = max(self.min_rate, state['rate'] / 2)
+                pause = self._parse_retry_after(retry_after)
+                state['blocked_until'] = time.monotonic() + (pause if pause is not None else 1 / state['rate'])
+                state['tokens'] = 0.0
+            elif status is None or status >= 500:
+                state['rate'] = max(self.min_rate, state['rate'] * 0.75)
+            elif latency > self.target_latency:
+                state['rate'] = max(self.min_rate, state['rate'] * 0.9)
+            else:
+                state['rate'] = min(self.max_rate, state['rate'] + self.increase)
+
+    def current_rate(self, url) -> float:
+        """
+        Returns the requests per second currently allowed for the host of url
+        """
+        with self.lock:
+            return self._host(url)['rate']
@@ -0,0 +1,171 @@
+import math
+import time
+
+import pandas as pd
+
+#Volatility-aware refresh planning, cards are rescraped when their price is expected to have moved, not on every run
+
+#How much a change in the price of each rarity matters, rarities not listed count 0.5
+RARITY_WEIGHTS = {
+    "Mythic": 1.0,
+    "Rare": 0.8,
+    "Special": 0.8,
+    "Masterpiece": 0.8,
+    "Uncommon": 0.4,
+    "Common": 0.25,
+    "Land": 0.25,
+    "Token": 0.25,
+}
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+def price_stats(history) -> dict:
+    """
+    Summarises the price history of each card
+
+    Parameters
+    ----------
+    history : pd.DataFrame
+        card_name, scrape_date, price_trend, rarity and available_count of every saved record, e.g. from price_history.set_history()
+
+    Returns
+    -------
+    dict
+        card name -> {volatility, price, rarity, available_count}, volatility is the mean relative change of price_trend per day
+        and None if the card has fewer than two days of prices
+    """
+    if history is None or len(history) == 0:
+        return {}
+    history = history.dropna(subset=['price_trend']).sort_values(['card_name', 'scrape_date'])
+    history = history.groupby(['card_name', 'scrape_date'], observed=True).last().reset_index()   #Last run of each day
+
+    stats = {}
+    for card_name, prices in history.groupby('card_name', observed=True):
+        latest = prices.iloc[-1]
+        previous = prices['price_trend'].shift()
+        days = pd.to_datetime(prices['scrape_date']).diff().dt.days
+        changes = ((prices['price_trend'] - previous).abs() / previous / days)[(previous > 0) & (days > 0)]
+        stats[str(card_name)] = {
+            'volatility': float(changes.mean()) if len(changes) else None,
+            'price': float(latest['price_trend']),
+            'rarity': None if pd.isna(latest['rarity']) else str(latest['rarity']),
+            'available_count': None if pd.isna(latest['available_count']) else int(latest['available_count']),
+        }
+    return stats
+
+class RefreshScheduler:
+    """
+    Gives each card a refresh interval from its price volatility, value, rarity and supply, and picks the cards that are due within a page budget
+
+    A card's interval is the time its price is expected to take to move by change_threshold, shortened for important cards and clamped
+    between min_interval_days and max_interval_days. Cards are due once the time since they were last scraped reaches their interval,
+    the most overdue relative to their interval are scraped first
+
+    Parameters
+    ----------
+    min_interval_days : float
+        Shortest time between two scrapes of a card, must be positive
+    max_interval_days : float
+        Longest time a card goes without being scraped
+    change_threshold : float
+        Relative price change worth a rescrape, e.g. 0.05 for 5%
+    prior_volatility : float
+        Relative change per day assumed for cards without enough history
+    bulk_price : float
+        Price below which a card counts as bulk and is refreshed less often
+    scarce_count : int
+        Number of available items below which a card counts as scarce and is refreshed more often
+
+    Attributes
+    ----------
+    bulk_weight : float
+        Importance multiplier of bulk cards
+    scarce_weight : float
+        Importance multiplier of scarce cards
+
+    Raises
+    ------
+    ValueError
+        If min_interval_days isn't positive or is above max_interval_days
+    """
+
+    def __init__(self, min_interval_days=0.5, max_interval_days=14, change_threshold=0.05, prior_volatility=0.02, bulk_price=0.25, scarce_count=20) -> None:
+        #plan() divides by the interval, so it can't be 0
+        if not 0 < min_interval_days <= max_interval_days:
+            raise ValueError(f"min_interval_days should be positive and at most max_interval_days, got {min_interval_days} and {max_interval_days}")
+        self.min_interval_days = min_interval_days
+        self.max_interval_days = max_interval_days
+        self.change_threshold = change_threshold
+        self.prior_volatility = prior_volatility
+        self.bulk_price = bulk_price
+        self.scarce_count = scarce_count
+        self.bulk_weight = 0.3
+        self.scarce_weight = 1.5
+
+    def importance(self, stats) -> float:
+        """
+        Returns how much a price change of the card matters, from its rarity, price and supply
+
+        Parameters
+        ----------
+        stats : dict
+            Entry of the card from price_stats()
+        """
+        weight = RARITY_WEIGHTS.get(stats.get('rarity'), 0.5)
+        if stats.get('price') is not None and stats['price'] < self.bulk_price:
+            weight *= self.bulk_weight
+        if stats.get('available_count') is not None and stats['available_count'] < self.scarce_count:
+            weight *= self.scarce_weight
+        return weight
+
+    def interval_days(self, stats) -> float:
+        """
+        Returns how many days may pass between two scrapes of a card
+
+        Parameters
+        ----------
+        stats : dict
+            Entry of the card from price_stats(), empty if it has no history
+        """
+        volatility = stats.get('volatility')
+        if volatility is None:
+            volatility = self.prior_volatility
+        interval = self.change_threshold / max(volatility, 1e-6) / max(self.importance(stats), 1e-6)
+        return min(max(interval, self.min_interval_days), self.max_interval_days)
+
+    def plan(self, card_names, scraped_at, stats, budget=None, now=None) -> list:
+        """
+        Returns the cards to scrape this run, most urgent first
+
+        Parameters
+        ----------
+        card_names : list[str]
+            Every card of the set
+        scraped_at : dict
+            card name -> unix time it was last scraped, cards missing from it have never been scraped and come first
+        stats : dict
+            card name -> entry from price_stats()
+        budget : int
+            Maximum number of cards to return, unlimited if None
+        now : float
+            Unix time of the run, defaults to now
+
+        Returns
+        -------
+        list[str]
+            Names of the cards that are due, cut to the budget
+        """
+        now = now or time.time()
+        due = []
+        for card_name in card_names:
+            last = scraped_at.get(card_name)
+            if last is None:
+                due.append((math.inf, card_name))
+                continue
+            overdue = (now - last) / SECONDS_PER_DAY / self.interval_days(stats.get(card_name, {}))
+            if overdue >= 1:
+                due.append((overdue, card_name))
+        due.sort(key=lambda item: item[0], reverse=True)
+        if budget is not None:
+            due = due[:budget]
+        return [card_name for overdue, card_name in due]
@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+
+class ScrapeJournal:
+    """
+    Append-only JSONL journal of scraped records, each line is fsync'd as soon as it is written so a crashed run can be resumed
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the journal file
+
+    Attributes
+    ----------
+    filepath : str
+        Path of the journal file
+    lock : threading.Lock
+        Serialises appends from concurrent scrape workers
+    """
+
+    def __init__(self, filepath) -> None:
+        self.filepath = filepath
+        self.lock = threading.Lock()
+
+    def reset(self) -> None:
+        """
+        Starts a new, empty journal
+        """
+        os.makedirs(os.path.dirname(self.filepath) or '.', exist_ok=True)
+        with open(self.filepath, 'w') as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, url, record) -> None:
+        """
+        Appends a record and flushes it to disk before returning
+
+        A final line torn by a crash is ended first, so the record doesn't run on from it and get skipped with it
+
+        Parameters
+        ----------
+        url : str
+            The URL the record was scraped from
+        record : dict
+            The scraped record
+        """
+        line = (json.dumps({'url': url, 'record': record}) + '\n').encode()
+        with self.lock:
+            os.makedirs(os.path.dirname(self.filepath) or '.', exist_ok=True)
+            with open(self.filepath, 'ab+') as f:
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        line = b'\n' + line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def entries(self):
+        """
+        Yields (url, record) for each line of the journal, skipping a partially written final line
+        """
+        if not os.path.isfile(self.filepath):
+            return
+        with open(self.filepath, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue    #Torn write from a crash, the card will be scraped again
+                yield entry['url'], entry['record']
+
+    def completed_urls(self) -> set:
+        """
+        Returns the set of urls that already have a record in the journal
+        """
+        return {url for url, record in self.entries()}
+
+    def records(self) -> list:
+        """
+        Returns the latest record for each url, sorted by set number
+        """
+        latest = {}
+        for url, record in self.entries():
+            latest[url] = record
+        return sorted(latest.values(), key=lambda k: k['set_number'])
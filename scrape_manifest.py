@@ -0,0 +1,140 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+def record_hash(record) -> str:
+    """
+    Returns the sha256 of a record's content, leaving out the uuid every scrape assigns afresh
+
+    Parameters
+    ----------
+    record : dict
+        The record to hash
+    """
+    content = {key: value for key, value in record.items() if key != 'uuid'}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+class ScrapeManifest:
+    """
+    Index of the cards of one set that have been saved, keyed by card name
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the manifest file
+
+    Attributes
+    ----------
+    filepath : str
+        Path of the manifest file
+    cards : dict
+        Maps card name to its set number, last scraped time, uuid and content hash of its saved record, loaded on first use
+    lock : threading.Lock
+        Guards cards when records are saved from several threads
+    """
+
+    def __init__(self, filepath) -> None:
+        self.filepath = filepath
+        self.cards = None
+        self.lock = threading.Lock()
+
+    def _load(self) -> dict:
+        """
+        Loads the manifest from disk, rebuilding it from the saved per-card jsons if it doesn't exist yet
+        """
+        if self.cards is None:
+            if os.path.isfile(self.filepath):
+                with open(self.filepath, 'r') as f:
+                    self.cards = json.load(f)
+            else:
+                self.cards = {}
+                self._rebuild()
+        return self.cards
+
+    def _rebuild(self) -> None:
+        """
+        Indexes the NNN.json files already saved next to the manifest
+        """
+        set_dir = os.path.dirname(self.filepath)
+        for filename in glob.glob(os.path.join(set_dir, '[0-9]*.json')):
+            with open(filename, 'r') as f:
+                self._add(json.load(f), os.path.getmtime(filename))
+
+    def _add(self, record, scraped_at) -> None:
+        """
+        Adds or replaces the entry of a record
+
+        Parameters
+        ----------
+        record : dict
+            The saved record
+        scraped_at : float
+            Unix time the record was scraped
+        """
+        self.cards[record['card_name']] = {
+            'set_number': record['set_number'],
+            'scraped_at': scraped_at,
+            'uuid': record.get('uuid'),
+            'sha256': record_hash(record),
+        }
+
+    def update(self, record) -> None:
+        """
+        Records that a card has just been saved
+
+        Parameters
+        ----------
+        record : dict
+            The saved record
+        """
+        with self.lock:
+            self._load()
+            self._add(record, time.time())
+
+    def touch(self, card_name) -> None:
+        """
+        Records that a card was scraped again without its record changing
+
+        Parameters
+        ----------
+        card_name : str
+            Name of the card
+        """
+        with self.lock:
+            entry = self._load().get(card_name)
+            if entry is not None:
+                entry['scraped_at'] = time.time()
+
+    def get(self, card_name) -> dict:
+        """
+        Returns the entry of a card, None if it has never been saved
+
+        Parameters
+        ----------
+        card_name : str
+            Name of the card
+        """
+        with self.lock:
+            return self._load().get(card_name)
+
+    def names(self) -> set:
+        """
+        Returns the names of every card in the manifest
+        """
+        with self.lock:
+            return set(self._load())
+
+    def save(self) -> None:
+        """
+        Atomically writes the manifest to disk
+        """
+        with self.lock:
+            self._load()
+            os.makedirs(os.path.dirname(self.filepath) or '.', exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(self.filepath)), delete=False) as f:
+                json.dump(self.cards, f)
+            os.replace(f.name, self.filepath)
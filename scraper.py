@@ -4,28 +4,139 @@ from uuid import uuid4
 from xmlrpc.client import Boolean
 from numpy import bool_, equal, number
 from selenium import webdriver
+from selenium.webdriver.firefox.options import Options as FirefoxOptions
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException, WebDriverException, NoSuchElementException
 import time
 import string
 
 import urllib3.exceptions
+from urllib.parse import urlsplit, unquote
 from mtg_card_data import MTGCardData
+import card_extraction
+import price_history
+from scrape_journal import ScrapeJournal
+from scrape_manifest import ScrapeManifest, record_hash
+from rate_limiter import RateLimiter
+from metrics import Metrics
+from image_store import ImageStore, file_hash
+from work_queue import WorkQueue, LEASED
+from snapshot_store import SnapshotStore
+from refresh_scheduler import RefreshScheduler, price_stats
 import random
 import json
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from lxml import html
 
 import boto3
 from botocore.exceptions import NoCredentialsError
 from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
 
 import pandas as pd
-from sqlalchemy import create_engine
-from zipfile import ZipFile
+from sqlalchemy import create_engine, inspect, text, MetaData, Table, Column, Integer, Float, Text
+from sqlalchemy.schema import CreateTable
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
+import warnings
 import glob
+import fnmatch
+import queue
+import threading
+import tempfile
+import socket
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+#Column types of mtgscraper_dataset, image_key is the key records are upserted on
+RDS_DTYPES = {
+    "card_name": Text(),
+    "rarity": Text(),
+    "available_count": Integer(),
+    "version_count": Integer(),
+    "set_number": Integer(),
+    "lowest_price": Float(),
+    "price_trend": Float(),
+    "average_price_30_day": Float(),
+    "average_price_7_day": Float(),
+    "average_price_1_day": Float(),
+    "image_url": Text(),
+    "image_key": Text(),
+    "uuid": Text(),
+    "set_code": Text(),
+}
+
+#Guards files shared by every Scraper in the process, raw_data.zip and the zip and S3 manifests
+shared_file_lock = threading.Lock()
+
+#Set code -> lock serialising the saves of a set by the Scrapers of the process that worked on it from the work queue
+set_save_locks = {}
+set_save_locks_lock = threading.Lock()
+
+def set_save_lock(set_code) -> threading.Lock:
+    """
+    Returns the lock serialising saves of a set within the process
+    """
+    with set_save_locks_lock:
+        return set_save_locks.setdefault(set_code, threading.Lock())
+
+#Politeness scheduler shared by every Scraper, worker and engine in the process
+shared_rate_limiter = RateLimiter()
+
+#Directory the JSON log and the Prometheus metrics file are written to, set by SCRAPER_OUTPUT_DIR
+OUTPUT_DIR = os.environ.get('SCRAPER_OUTPUT_DIR', 'scraper_output')
+
+#Stage timings, counters and structured log shared by every Scraper in the process, SCRAPER_LOG_FILE overrides where the JSON log is written
+shared_metrics = Metrics(log_filepath=os.environ.get('SCRAPER_LOG_FILE', os.path.join(OUTPUT_DIR, 'scraper_log.jsonl')))
+shared_metrics.describe('mtgscraper_pages_total', 'counter', 'Product pages scraped into a record, by engine')
+shared_metrics.describe('mtgscraper_failures_total', 'counter', 'Failed attempts at scraping a card, by failure category')
+shared_metrics.describe('mtgscraper_images_total', 'counter', 'Image downloads, by HTTP status')
+shared_metrics.describe('mtgscraper_records_total', 'counter', 'Saved records, by whether they were new, changed or unchanged')
+shared_metrics.describe('mtgscraper_s3_files_total', 'counter', 'Files considered for S3 upload, by whether they were uploaded or unchanged')
+shared_metrics.describe('mtgscraper_rds_rows_total', 'counter', 'Rows upserted into RDS')
+
+#Firefox preferences of the lean driver profile, _scrape only reads the served DOM so nothing else needs loading
+LEAN_FIREFOX_PREFS = {
+    "permissions.default.image": 2,                     #Images are downloaded separately in save()
+    "browser.display.use_document_fonts": 0,            #Skip web fonts
+    "media.autoplay.default": 5,                        #Block all autoplaying audio and video
+    "media.preload.default": 0,
+    "network.prefetch-next": False,
+    "network.dns.disablePrefetch": True,
+    "network.http.speculative-parallel-limit": 0,
+    "privacy.trackingprotection.enabled": True,         #Block ads, analytics and other third party trackers
+    "privacy.trackingprotection.socialtracking.enabled": True,
+    "privacy.trackingprotection.cryptomining.enabled": True,
+    "privacy.trackingprotection.fingerprinting.enabled": True,
+    "network.cookie.cookieBehavior": 1,                 #Reject third party cookies
+    "browser.cache.disk.enable": False,
+    "browser.sessionhistory.max_entries": 2,
+    "dom.ipc.processCount": 1,                          #One content process per driver to save memory
+}
+
+class PageNotFoundError(Exception):
+    """
+    Raised when a card's url doesn't lead to its product page, e.g. a wrong slug redirected to search
+    """
+
+class DriverDiedError(Exception):
+    """
+    Raised by a pool worker whose browser session no longer responds, the card it was on is put back for another driver
+    """
+
+def _same_page(url, final_url) -> bool:
+    """
+    Returns whether final_url is the page url was requested as, ignoring percent-encoding, a trailing slash and the query string
+
+    Browsers and requests report the final url percent-encoded, e.g. Lim-Dûls-Vault comes back as Lim-D%C3%BBls-Vault
+    """
+    requested, final = urlsplit(url), urlsplit(final_url)
+    return (requested.netloc.lower() == final.netloc.lower()
+            and unquote(requested.path).rstrip('/') == unquote(final.path).rstrip('/'))
 
 class Scraper:
     """
@@ -53,6 +164,12 @@ class Scraper:
         URL of the endpoint of the RDS instance to upload to 
     debug : bool
         Whether or not to enable debugging
+    worker_count : int
+        Number of webdrivers to scrape with concurrently, 1 scrapes sequentially with a single driver
+    engine : str
+        "selenium" renders every page in Firefox, "http" fetches and parses pages directly and only falls back to Firefox when needed
+    lean_driver : bool
+        Whether to start Firefox headless, with eager page loads and images, fonts, media and trackers blocked
     
 
     Attributes
@@ -71,8 +188,20 @@ class Scraper:
         Whether or not to use a local cardlist.txt or check for missing cards serverside to scrape
     formatted_card_list : list[str]
         Contains card urls formatted for cardmarket
+    engine : str
+        Which engine _scrape_card uses to fetch and parse product pages
+    lean_driver : bool
+        Whether new drivers use the lean, headless profile
     driver : webdriver
-        Selenium webdriver
+        Selenium webdriver, created lazily by the http engine the first time a page needs a browser
+    driver_lock : threading.Lock
+        Serialises use of driver by http engine workers that fall back to Selenium
+    session : requests.Session
+        Pooled HTTP session used by the http engine
+    rate_limiter : RateLimiter
+        Per-host politeness scheduler every page load waits on, shared across scrapers
+    worker_count : int
+        Number of webdrivers pulling card urls from a shared work queue during run()
     delay : int
         Maximum time in seconds to wait for website to load
     root_save_dir : str
@@ -81,19 +210,101 @@ class Scraper:
         Name of the file to save to in JSON format
     image_dir : str
         Directory to save images to
-    database : list[MTGCardData]
-        Contains class to store scraped data
+    image_cache_filename : str
+        Name of the file in image_dir storing the ETag/Last-Modified of each downloaded image
+    image_store_dir : str
+        Directory in root_save_dir every set's images are stored in once by content hash, the files in image_dir link to it
+    image_manifest_filename : str
+        Name of the file in image_dir mapping each image to its stored object and WebP variants
+    image_store : ImageStore
+        Content-addressed store of the images of every set, which also makes their thumbnails and WebP variants
+    download_workers : int
+        Maximum number of images downloaded concurrently in save()
+    image_timings : list[tuple]
+        (filename, seconds, status) of every image handled by the last save()
+    database_lock : threading.Lock
+        Guards the failures of a run when several drivers scrape concurrently
+    journal_filename : str
+        Name of the append-only journal each record is written to as soon as it is scraped
+    worker_journal_pattern : str
+        Glob of the per-worker journals of run_queue(), the * is replaced by the worker id
+    journal : ScrapeJournal
+        Journal of the current set, used to resume crashed runs and as the source of save()
+    manifest_filename : str
+        Name of the per-set index of saved cards
+    manifest : ScrapeManifest
+        Index of the cards of the current set that have been saved, used to skip them in local mode
+    snapshot_dir : str
+        Directory every fetched product page is archived in, kept out of root_save_dir so the archive isn't zipped and uploaded
+    snapshot_pages : bool
+        Whether to archive fetched product pages so replay() can re-run extraction without the network
+    snapshots : SnapshotStore
+        Archive of the fetched product pages, indexed per set
+    replay_dir : str
+        Directory replay() journals and save() writes replayed records to, kept apart from root_save_dir so replays never overwrite live data
+    replaying : bool
+        Whether the records in journal came from replay(), save() then only writes them to replay_dir and upload() does nothing
+    replay_before : float
+        Unix time the last replay() was limited to, None for the latest snapshots
+    refresh_schedule : bool
+        Whether _create_url_list() picks the saved cards that are due for a refresh instead of skipping every saved card
+    refresh_scheduler : RefreshScheduler
+        Gives each card a refresh interval from its price history, rarity and supply
+    refresh_budget : int
+        Maximum number of cards scraped per set when refresh_schedule is on, unlimited if None
+    refresh_history_days : int
+        Number of days of price history the refresh intervals are estimated from
+    record_queue : queue.Queue
+        Bounded queue scraped records are streamed through while run_pipeline() is active, None otherwise
+    changed_records : list[dict]
+        Records of the last save() that were new or differed from their saved version, None before the first save()
+    change_summary : dict
+        Number of new, changed and unchanged records in the last save() or run_pipeline()
     successfully_handled_cookies : bool 
         Tracks whether or not the driver handled the cookies prompt
-    get_url_log : list[str]
-        History of webpages that were attempted to visit
-    real_url_log : list[str]
-        History of webpages that were visited by the driver
+    url_log_size : int
+        Number of urls kept in get_url_log and driver_url_log
+    get_url_log : collections.deque
+        Most recent webpages that were attempted to visit
+    driver_url_log : collections.deque
+        Most recent webpages that were visited by the driver
+    metrics : Metrics
+        Stage timings, counters and structured log, shared with every other Scraper in the process
+    metrics_filename : str
+        File the metrics are dumped to in Prometheus text format after each run, save and upload, in OUTPUT_DIR by default
     zip_filename : str
         Name of the zip file
+    history_dir : str
+        Root of the Parquet price history dataset each save adds a partition to
+    zip_manifest_filename : str
+        Name of the file recording the size and modification time of every file in the zip
+    s3_manifest_filename : str
+        Name of the local manifest holding the content hash of every object uploaded to S3
+    s3_upload_workers : int
+        Maximum number of files uploaded to S3 concurrently
+    max_attempts : int
+        Number of times a card failing with a transient error is tried in one run
+    driver_restarts : int
+        Number of times a pool worker restarts a driver whose browser died in one attempt before it stops taking cards
+    retry_backoff : float
+        Seconds waited before the first retry of failed cards, doubled for each retry after it
+    failure_report_filename : str
+        Name of the per-set report of cards that could not be scraped
+    table_name : str
+        Name of the RDS table records are upserted into
+    rds_chunksize : int
+        Number of rows sent to RDS per batch
+    remote_cache_filename : str
+        Name of the per-set cache of card names already in RDS
+    remote_cache_seconds : int
+        How long the cache of card names already in RDS is used before querying RDS again
+    task_table_name : str
+        Name of the table of the distributed work queue used by enqueue() and run_queue()
+    task_lease_seconds : float
+        How long a claimed card is leased to this scraper before another may take it over, extended by heartbeats while scraping
     """
     
-    def __init__(self, target_url, set_url, set_code, local_target_list, target_list_filepath, to_upload, upload_file_name, bucket_name, rds_endpoint, debug) -> None:
+    def __init__(self, target_url, set_url, set_code, local_target_list, target_list_filepath, to_upload, upload_file_name, bucket_name, rds_endpoint, debug, worker_count=1, engine="selenium", lean_driver=True) -> None:
         
         #Control
         self.debug = debug
@@ -103,32 +314,69 @@ class Scraper:
         #Url
         self.url_base = target_url
         self.url_mtg_section = "/en/Magic/Products/Singles/"
-        self.url_set_name = set_url
-        self.target_list_filepath = target_list_filepath
-        self.formatted_card_list = []
         
         #Webdriver
-        self.driver = webdriver.Firefox()
+        self.engine = engine
+        self.lean_driver = lean_driver
+        self.driver = self._create_driver() if self.engine == "selenium" else None
+        self.driver_lock = threading.Lock()
         self.delay = 10
+        self.worker_count = max(1, worker_count)
+        self.download_workers = 16
+        self.session = self._create_session()
+        self.rate_limiter = shared_rate_limiter
 
         #Data
         self.root_save_dir = "raw_data" 
         self.json_filename = "data.json"
         self.image_dir = "images"
-        self.database = []
-        self.set_code = set_code
+        self.image_cache_filename = "image_cache.json"
+        self.image_store_dir = "image_store"
+        self.image_manifest_filename = "image_manifest.json"
+        self.image_store = ImageStore(os.path.join(self.root_save_dir, self.image_store_dir))
+        self.image_timings = []
+        self.database_lock = threading.Lock()
         self.zip_filename = "raw_data.zip"
+        self.zip_manifest_filename = "raw_data_zip_manifest.json"
+        self.history_dir = "price_history"
+        self.journal_filename = "journal.jsonl"
+        self.worker_journal_pattern = "journal-*.jsonl"
+        self.manifest_filename = "manifest.json"
+        self.snapshot_dir = "snapshots"
+        self.snapshot_pages = True
+        self.replay_dir = "replay"
+        self.refresh_schedule = False
+        self.refresh_scheduler = RefreshScheduler()
+        self.refresh_budget = None
+        self.refresh_history_days = 30
+        self.record_queue = None
+        self.retarget(set_url, set_code, target_list_filepath)
 
         #Error Checking
         self.successfully_handled_cookies = False
-        self.get_url_log = []   
-        self.driver_url_log = []   
+        self.max_attempts = 3
+        self.driver_restarts = 3
+        self.retry_backoff = 30
+        self.failure_report_filename = "failures.json"
+        self.url_log_size = 1000
+        self.get_url_log = deque(maxlen=self.url_log_size)
+        self.driver_url_log = deque(maxlen=self.url_log_size)
+        self.metrics = shared_metrics
+        self.metrics_filename = os.path.join(OUTPUT_DIR, "metrics.prom")
 
         #Uploading
         self.upload_file_name = upload_file_name
         self.bucket_name = bucket_name
         self.rds_endpoint = rds_endpoint
         self.dataframe = pd.DataFrame
+        self.s3_manifest_filename = "s3_manifest.json"
+        self.s3_upload_workers = 8
+        self.table_name = "mtgscraper_dataset"
+        self.rds_chunksize = 1000
+        self.remote_cache_filename = "remote_scraped.json"
+        self.remote_cache_seconds = 6 * 60 * 60
+        self.task_table_name = "mtgscraper_tasks"
+        self.task_lease_seconds = 300
         
         DATABASE_TYPE = os.environ.get('DATABASE_TYPE')
         DBAPI = os.environ.get('DBAPI')
@@ -139,18 +387,104 @@ class Scraper:
         self.database_access = f"{DATABASE_TYPE}+{DBAPI}://{USER}:{PASSWORD}@{self.rds_endpoint}:{PORT}/{DATABASE}"
 
     
-    def _geturl(self, url) -> None:
+    def retarget(self, set_url, set_code, target_list_filepath) -> None:
+        """
+        Points the scraper at a set, clearing the records of the previous one while keeping the driver, session and cookies
+
+        Parameters
+        ----------
+        set_url : str
+            MTG set name in url format for cardmarket
+        set_code : str
+            MTG three letter expansion code of the set
+        target_list_filepath : str
+            Filepath of the names of cards to scrape
+        """
+        self.url_set_name = set_url
+        self.set_code = set_code
+        self.target_list_filepath = target_list_filepath
+        self.formatted_card_list = []
+        self.changed_records = None
+        self.change_summary = {'new': 0, 'changed': 0, 'unchanged': 0}
+        self.journal = ScrapeJournal(os.path.join(self.root_save_dir, self.set_code, self.journal_filename))
+        self.manifest = ScrapeManifest(os.path.join(self.root_save_dir, self.set_code, self.manifest_filename))
+        self.snapshots = SnapshotStore(self.snapshot_dir, self.set_code)
+        self.replaying = False
+        self.replay_before = None
+
+    def _create_driver(self) -> webdriver.Firefox:
+        """
+        Creates a new webdriver for the scraper or one of its pool workers, using the lean profile if lean_driver is set
+        """
+        if not self.lean_driver:
+            return webdriver.Firefox()
+
+        options = FirefoxOptions()
+        options.add_argument('-headless')
+        options.page_load_strategy = 'eager'    #Return once the DOM is parsed, the data table is waited for explicitly
+        for name, value in LEAN_FIREFOX_PREFS.items():
+            options.set_preference(name, value)
+        return webdriver.Firefox(options=options)
+
+    def _create_session(self) -> requests.Session:
+        """
+        Creates a requests session with a connection pool large enough for every scrape worker and image download
         """
-        Commands the driver to load the given url, waits for the page to load and logs the desired url and visited url
+        session = requests.Session()
+        pool_size = max(self.worker_count, self.download_workers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:102.0) Gecko/20100101 Firefox/102.0',
+            'Accept-Language': 'en-GB,en;q=0.5',
+        })
+        return session
+
+    def _ensure_driver(self) -> None:
+        """
+        Starts the webdriver and handles cookies if the http engine has not needed a browser yet
+        """
+        if self.driver is None:
+            if(self.debug):
+                print("Starting fallback driver")
+            self.driver = self._create_driver()
+            self._startup()
+            self._handle_cookies()
+
+    @staticmethod
+    def _driver_alive(driver) -> bool:
+        """
+        Returns whether the driver's browser session still answers commands
+        """
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _geturl(self, url, driver=None) -> None:
+        """
+        Waits for the rate limiter, commands the driver to load the given url and logs the desired url and visited url
         Parameters
         ----------
         url : str
             The URL to load 
+        driver : webdriver
+            Driver to load the url with, defaults to the scraper's own driver
         """
-        self.driver.get(url)
+        driver = driver or self.driver
+        self.rate_limiter.acquire(url) # Pace requests so the website doesn't suspect we're a bot
+        start = time.perf_counter()
+        try:
+            with self.metrics.timer('geturl'):
+                driver.get(url)
+        except BaseException:
+            self.rate_limiter.record(url, time.perf_counter() - start, status=None)
+            raise
+        self.rate_limiter.record(url, time.perf_counter() - start)
         self.get_url_log.append(url)
-        time.sleep(2) # Wait a couple of seconds, so the website doesn't suspect we're a bot
-        self.driver_url_log.append(self.driver.current_url)
+        self.driver_url_log.append(driver.current_url)
 
     def _startup(self) -> None:
         """
@@ -164,7 +498,10 @@ class Scraper:
         """
         Closes all windows and exits the driver
         """
-        
+        self.session.close()
+        if self.driver is None:
+            return
+
         if(self.debug):
             print('PreQuit ID: ' + self.driver.session_id)
             print('PreQuit Profile: ' + str(self.driver.profile))
@@ -192,15 +529,21 @@ class Scraper:
                 print('Error caught successfully')
 
 
-    def _handle_cookies(self) -> None:
+    def _handle_cookies(self, driver=None) -> None:
         """
         Finds and commands the driver to click on the accept cookies button
+
+        Parameters
+        ----------
+        driver : webdriver
+            Driver to accept cookies with, defaults to the scraper's own driver
         """
         if(self.debug):
             print("Handle_Cookies")
+        driver = driver or self.driver
         try: 
-            WebDriverWait(self.driver, self.delay).until(EC.presence_of_element_located((By.XPATH, '//div[@id="CookiesConsent"]')))
-            accept_cookies_button = self.driver.find_element_by_xpath('//button[@aria-label="Accept All Cookies"]')
+            WebDriverWait(driver, self.delay).until(EC.presence_of_element_located((By.XPATH, '//div[@id="CookiesConsent"]')))
+            accept_cookies_button = driver.find_element_by_xpath('//button[@aria-label="Accept All Cookies"]')
             accept_cookies_button.click()
         except TimeoutException:
             print("Loading took much time (>" + string(self.delay) + "s)")
@@ -208,19 +551,22 @@ class Scraper:
             print(f"Unexpected {err=}, {type(err)=}")
             raise
         else:
-            self.successfully_handled_cookies = True
+            if driver is self.driver:
+                self.successfully_handled_cookies = True
 
     def _create_url_list(self) -> None:
         """
-        Loads the cardlist txt file and generates a list of urls to scrape from, removing previously scraped elements
+        Loads the cardlist txt file and generates a list of urls to scrape from, removing previously scraped elements,
+        or with refresh_schedule only keeping the cards that are due for a refresh
         """
         if(self.debug):
             print("Create_Url_List")
+        self.formatted_card_list = []
 
         #load NEO_cardlist.txt
         cardlist_filename = self.target_list_filepath
         card_namelist = []
-        scraped_namelist = []
+        scraped_namelist = set()
         try:
             with open(cardlist_filename, 'r') as f:
                 card_namelist = f.readlines()
@@ -232,33 +578,27 @@ class Scraper:
             card_namelist[-1] += '\n'      
 
         #Remove previously scraped elements
-        if(self.local_target_list):
-            #Open each XXX.json and get card name
-            for filename in glob.glob(os.path.join(f'{self.root_save_dir}/{self.set_code}/', '*.json')):
-                if filename != f'{self.root_save_dir}/{self.set_code}/{self.json_filename}':
-                    try:
-                        with open(os.path.join(os.getcwd(), filename), 'r') as f:
-                            scraped_dict = json.load(f)
-                            scraped_namelist.append(scraped_dict['card_name'] + '\n')
-                    except BaseException as err:
-                        print("Could not open " + cardlist_filename + " for reading.")
-                        print(f"Unexpected {err=}, {type(err)=}")   
-                        raise
+        if(self.refresh_schedule):
+            card_namelist = [name + '\n' for name in self._refresh_plan([x.rstrip('\n') for x in card_namelist])]
+        elif(self.local_target_list):
+            #Look up saved card names in the set's manifest
+            try:
+                scraped_namelist = self.manifest.names()
+            except BaseException as err:
+                print("Could not read " + self.manifest.filepath)
+                print(f"Unexpected {err=}, {type(err)=}")   
+                raise
         else:
-            #Connect to RDS and pull names of previously scraped cards
+            #Pull names of previously scraped cards of this set from RDS, or the local cache of them
             try:
-                engine = create_engine(self.database_access)
-                engine.connect()
-                server_dataframe = pd.read_sql_query('SELECT card_name from public.mtgscraper_dataset', engine)
-                scraped_namelist = server_dataframe['card_name'].tolist()
-                engine.dispose()
+                scraped_namelist = self._remote_scraped_names()
             except BaseException as err:
                         print("Could not read mtgscraper_dataset")
                         print(f"Unexpected {err=}, {type(err)=}")   
                         raise
 
         #Get diff of entire set namelist and scraped namelist
-        card_namelist = [x for x in card_namelist if x not in scraped_namelist]
+        card_namelist = [x for x in card_namelist if x.rstrip('\n') not in scraped_namelist]
 
         #Convert name to url syntax
         for name in card_namelist:
@@ -268,7 +608,83 @@ class Scraper:
             name = name.replace('\n', '')  #Remove \n at end of name
             self.formatted_card_list.append(name)
         
-    def _scrape(self, url) -> None:
+    def _refresh_plan(self, card_namelist) -> list:
+        """
+        Returns the cards of the set that are due for a refresh, most overdue first and at most refresh_budget of them
+
+        Cards are timed from the manifest and their intervals estimated from the set's Parquet price history
+
+        Parameters
+        ----------
+        card_namelist : list[str]
+            Names of every card of the set
+        """
+        scraped_at = {}
+        for name in card_namelist:
+            entry = self.manifest.get(name)
+            if entry is not None:
+                scraped_at[name] = entry['scraped_at']
+
+        since = datetime.date.today() - datetime.timedelta(days=self.refresh_history_days)
+        try:
+            history = price_history.set_history(self.history_dir, self.set_code,
+                columns=("card_name", "scrape_date", "price_trend", "rarity", "available_count"), since=since).to_pandas()
+            stats = price_stats(history)
+        except Exception as err:
+            print("Could not read the price history of " + self.set_code + ", using default refresh intervals")
+            print(f"Unexpected {err=}, {type(err)=}")
+            stats = {}
+
+        plan = self.refresh_scheduler.plan(card_namelist, scraped_at, stats, budget=self.refresh_budget)
+        never_scraped = sum(1 for name in plan if name not in scraped_at)
+        print(f"{self.set_code}: refreshing {len(plan)} of {len(card_namelist)} cards ({never_scraped} never scraped)")
+        self.metrics.log('refresh_plan', set_code=self.set_code, cards=len(card_namelist), planned=len(plan),
+                         never_scraped=never_scraped, budget=self.refresh_budget)
+        return plan
+
+    def _remote_cache_path(self) -> str:
+        """
+        Returns the path of the cache of card names already in RDS for the current set
+        """
+        return os.path.join(self.root_save_dir, self.set_code, self.remote_cache_filename)
+
+    def _remote_scraped_names(self) -> set:
+        """
+        Returns the names of this set's cards already in RDS
+
+        The names are read from the local cache while it is younger than remote_cache_seconds, 
+        otherwise only this set's rows are queried through the (set_code, card_name) index and the cache is refreshed.
+        Nothing is written to RDS, a missing table has no names and rows of tables not yet migrated by an upload are matched on their image_key
+        """
+        cache = self._load_json_file(self._remote_cache_path())
+        if cache and time.time() - cache['fetched_at'] < self.remote_cache_seconds:
+            if(self.debug):
+                print(f"Using cached RDS card names from {self._remote_cache_path()}")
+            return set(cache['names'])
+
+        engine = create_engine(self.database_access)
+        try:
+            with engine.connect() as connection:
+                inspector = inspect(connection)
+                if not inspector.has_table(self.table_name):
+                    names = []
+                else:
+                    prefix_match = "image_key LIKE :prefix ESCAPE '!'"
+                    if 'set_code' in [column['name'] for column in inspector.get_columns(self.table_name)]:
+                        condition = f'set_code = :set_code OR (set_code IS NULL AND {prefix_match})'
+                    else:
+                        condition = prefix_match
+                    names = connection.execute(
+                        text(f'SELECT card_name FROM {self.table_name} WHERE {condition}'),
+                        {'set_code': self.set_code, 'prefix': f'{self.set_code}!_%'}).scalars().all()
+        finally:
+            engine.dispose()
+
+        os.makedirs(os.path.dirname(self._remote_cache_path()), exist_ok=True)
+        self._save_json_file(self._remote_cache_path(), {'fetched_at': time.time(), 'names': sorted(names)})
+        return set(names)
+
+    def _scrape(self, url, driver=None) -> None:
         """
         Scrapes data from the given url
         
@@ -276,260 +692,1380 @@ class Scraper:
         ----------
         url : str
             The URL to scrape data from 
+        driver : webdriver
+            Driver to scrape with, defaults to the scraper's own driver
         """
-        self._geturl(url)
-        scraped_data = MTGCardData()
-        scraped_data.dict['version_count'] = 0
+        driver = driver or self.driver
+        self._geturl(url, driver)
+        if not _same_page(url, driver.current_url):
+            raise PageNotFoundError(f"{url} redirected to {driver.current_url}")
 
         #Wait until tabel containing the data we want to scrape is loaded in
-        WebDriverWait(self.driver, self.delay).until(EC.presence_of_element_located((By.XPATH, '//dl[@class="labeled row no-gutters mx-auto"]'))) 
+        with self.metrics.timer('wait_for_table'):
+            WebDriverWait(driver, self.delay).until(EC.presence_of_element_located((By.XPATH, card_extraction.TABLE_XPATH))) 
+        if self.snapshot_pages:
+            self.snapshots.put(url, driver.page_source.encode(), driver.current_url)
 
-        #Get each table description and corresponding value
-        for dt in self.driver.find_element_by_xpath('//dl[@class="labeled row no-gutters mx-auto"]').find_elements_by_xpath('.//dt'):
-            
-            dd = dt.find_element_by_xpath('.//following-sibling::dd')
+        #Get the table, name and image in a single script call rather than a round trip per element
+        with self.metrics.timer('extract', engine='selenium'):
+            extracted = card_extraction.extract_from_driver(driver)
+            if extracted is None or extracted['title'] is None or extracted['image'] is None:
+                raise NoSuchElementException(f"Product page {url} is missing its data table, title or image")
 
-            #Rarity
-            if(dt.text == "Rarity"):
-                if(self.debug):
-                    print("RARITY -> " + dd.find_element_by_xpath('.//span').get_attribute("data-original-title"))
-                scraped_data.dict['rarity'] = dd.find_element_by_xpath('.//span').get_attribute("data-original-title")
-
-            #Reprints
-            elif(dt.text == "Reprints"):
-                version_count = 0
-                number_str = dd.find_element_by_xpath('.//a').text  #Get string of the number between parentheses
-                if(number_str.find('(') == -1):
-                    version_count = 1   #If no number in parenthses found then there is only one reprint of that card on cardmarket
-                else:
-                    if(self.debug):
-                        print("REPRINTS -> " + dd.find_element_by_xpath('.//a').text)
-                    number_str = number_str[number_str.find('(') + 1 : number_str.find(')')]
-                    version_count = int(number_str)
-                scraped_data.dict['version_count'] = version_count
-
-            #Printed in
-            elif(dt.text == "Printed in"):
-                if(self.debug):
-                    print("Printed in")
-                pass    #Expected input but we won't do anything with it
+            scraped_data = MTGCardData(version_count=0)
+            card_extraction.fill_record(scraped_data, extracted, self.debug)
+        scraped_data.image_key = f'{self.set_code}_{scraped_data.set_number:03d}'
 
-            #Availble items
-            elif(dt.text == "Available items"):
-                if(self.debug):
-                    print(dt.text + " -> " + dd.text)
-                scraped_data.dict['available_count'] = int(dd.text)
+        #UUID
+        scraped_data.uuid = str(uuid4())
 
-            #Set Number
-            elif(dt.text == "Number"):
-                if(self.debug):
-                    print(dt.text + " -> " + dd.text)
-                scraped_data.dict['set_number'] = int(dd.text)
+        self._record(url, scraped_data, 'selenium')
 
+    def _record(self, url, scraped_data, engine) -> None:
+        """
+        Validates and journals a scraped record, and hands it to the persist stage when running as a pipeline
 
-            #Prices
-            elif(dt.text == "From" or "Price Trend" or "30-days average price" or "7-days average price" or "1-day average price"):
-                if(self.debug):
-                    print(dt.text + " -> " + dd.text)
-
-                #Clip €/£ from end of string and convert to floating point 
-                price_str = dd.text
-                price_str = price_str.replace(',', '.')
-                price_str = price_str.replace(' ', '')
-                price_str = price_str.replace('€', '')
-                price_str = price_str.replace('£', '')
-
-                price = float(price_str)
-
-                if(dt.text == "From"):
-                    scraped_data.dict['lowest_price'] = price
-                elif(dt.text == "Price Trend"):
-                    scraped_data.dict['price_trend'] = price
-                elif(dt.text == "30-days average price"):
-                    scraped_data.dict['average_price_30_day'] = price
-                elif(dt.text == "7-days average price"):
-                    scraped_data.dict['average_price_7_day'] = price
-                else:
-                    scraped_data.dict['average_price_1_day'] = price
+        Records are not kept in memory, save() reads them back from the journal
 
-            else:
-                print("Unexpected input: " + dt.text)
+        Parameters
+        ----------
+        url : str
+            The URL the record was scraped from
+        scraped_data : MTGCardData
+            The scraped record
+        engine : str
+            What scraped the page, selenium, http or replay
+        """
+        scraped_data.validate()
+        record = scraped_data.to_dict()
+        self.journal.append(url, record)
+        self.metrics.increment('mtgscraper_pages_total', engine=engine)
+        self.metrics.log('page_scraped', set_code=self.set_code, url=url, engine=engine, card_name=record['card_name'], price_trend=record['price_trend'])
+        if self.record_queue is not None:
+            self.record_queue.put(record)   #Blocks while downstream stages catch up
+
+    def _scrape_http(self, url) -> bool:
+        """
+        Fetches the given url with the pooled session and scrapes it without a browser
+
+        Returns False without recording anything when the page is blocked or does not contain the served data table, so the caller can fall back to Selenium
+
+        Parameters
+        ----------
+        url : str
+            The URL to scrape data from
+        """
+        self.rate_limiter.acquire(url) # Pace requests so the website doesn't suspect we're a bot
+        start = time.perf_counter()
+        try:
+            with self.metrics.timer('http_get'):
+                response = self.session.get(url, timeout=self.delay)
+        except requests.RequestException:
+            self.rate_limiter.record(url, time.perf_counter() - start, status=None)
+            raise
+        self.rate_limiter.record(url, time.perf_counter() - start, response.status_code, response.headers.get('Retry-After'))
+        self.get_url_log.append(url)
+        self.driver_url_log.append(response.url)
+        if response.status_code == 404 or not _same_page(url, response.url):
+            raise PageNotFoundError(f"{url} returned {response.status_code} from {response.url}")
+        if response.status_code != 200:
+            if(self.debug):
+                print(f"HTTP {response.status_code} for {url}, falling back to Selenium")
+            return False
+
+        if self.snapshot_pages:
+            self.snapshots.put(url, response.content, response.url)
+        if not self._scrape_html(url, response.content, response.url, 'http'):
+            if(self.debug):
+                print(f"Served page for {url} is incomplete, falling back to Selenium")
+            return False
+        return True
+
+    def _scrape_html(self, url, content, base_url, engine) -> bool:
+        """
+        Extracts and records a card from the html of its product page, returning False without recording anything if the page is incomplete
+
+        Parameters
+        ----------
+        url : str
+            The URL the page was requested from
+        content : bytes
+            The page's html
+        base_url : str
+            URL the page was served from, relative image urls are resolved against it
+        engine : str
+            What produced the page, http or replay
+        """
+        with self.metrics.timer('extract', engine=engine):
+            extracted = card_extraction.extract_from_html(html.fromstring(content), base_url)
+            if extracted is None or extracted['title'] is None or extracted['image'] is None:
+                return False
+
+            scraped_data = MTGCardData(version_count=0)
+            card_extraction.fill_record(scraped_data, extracted, self.debug)
+        scraped_data.image_key = f'{self.set_code}_{scraped_data.set_number:03d}'
+        scraped_data.uuid = str(uuid4())
+
+        self._record(url, scraped_data, engine)
+        return True
+
+    def replay(self, before=None) -> None:
+        """
+        Re-runs extraction over the latest archived snapshot of every page of the set without touching the network, 
+        journaling the records so save() can follow
+
+        The records go to a journal in replay_dir, leaving the set's own journal intact for run(resume=True)
+
+        Parameters
+        ----------
+        before : float
+            Replay the snapshots as they were at this unix time, defaults to the latest
+        """
+        self.replaying = True
+        self.replay_before = before
+        self.journal = ScrapeJournal(os.path.join(self.replay_dir, self.set_code, self.journal_filename))
+        self.journal.reset()
+        snapshots = self.snapshots.latest(before)
+        failures = {}
+        start = time.perf_counter()
+        for url, entry in snapshots.items():
+            try:
+                if not self._scrape_html(url, self.snapshots.get(entry['sha256']), entry['final_url'], 'replay'):
+                    raise NoSuchElementException(f"Snapshot of {url} is missing its data table, title or image")
+            except Exception as err:
+                self._record_failure(failures, url.rstrip('/').split('/')[-1], url, err, 1)
+        print(f'Replayed {len(snapshots) - len(failures)}/{len(snapshots)} snapshots of {self.set_code} in {time.perf_counter() - start:.2f}s')
+
+    def _scrape_card(self, url, driver=None) -> None:
+        """
+        Scrapes the given url with the configured engine, falling back to Selenium when the http engine cannot read the page
+
+        Parameters
+        ----------
+        url : str
+            The URL to scrape data from
+        driver : webdriver
+            Driver to scrape with when using Selenium, defaults to the scraper's own driver
+        """
+        if self.engine == "http":
+            if self._scrape_http(url):
+                return
+            with self.driver_lock:
+                self._ensure_driver()
+                self._scrape(url)
+        else:
+            self._scrape(url, driver)
+
+    def save(self, dict_list=None) -> None:
+        """
+        Saves data to raw_data.json and images to the images directory, building both from the journal so records from resumed runs are included
+
+        Records are diffed against their last saved version and only new or changed ones are written, unchanged ones keep their saved uuid
+
+        Parameters
+        ----------
+        dict_list : list[dict]
+            Records of the set sorted by set number, defaults to the records in the journal
+        """
+        if self.replaying:
+            self._save_replay()
+            return
+
+        self._create_save_dirs()
+        if dict_list is None:
+            dict_list = self.journal.records()  #List of dictionaries sorted by set number
+
+        #Save .json for individual records that have changed
+        self.changed_records = []
+        self.change_summary = {'new': 0, 'changed': 0, 'unchanged': 0}
+        for dict in dict_list:
+            change = self._diff_record(dict)
+            self.change_summary[change] += 1
+            if change != 'unchanged':
+                self._save_record_json(dict)
+                self.changed_records.append(dict)
+        self.manifest.save()
+
+        #Merge this run's records into the .json of all records, only rewritten when a record has changed
+        if self.changed_records or not exists(self.root_save_dir + '/' + self.set_code + '/' + self.json_filename):
+            self._save_set_json(dict_list)
+        self._print_change_summary()
         
-        #Get Name
-        name_string = self.driver.find_element_by_xpath('//h1').text
-        name_string = name_string[0 : name_string.find('\n')]
-        if(self.debug):
-            print("NAME -> " + name_string)
-        scraped_data.dict['card_name'] = name_string
+        #Add today's prices to the history dataset
+        price_history.write_partition(dict_list, self.history_dir, self.set_code)
 
-        #Get Image
-        card_image_url = self.driver.find_element_by_xpath('//img[@class="is-front"]').get_attribute("src")
-        if(self.debug):
-            print("Card url: " + card_image_url)            
-        scraped_data.dict['image_url'] = card_image_url
-        scraped_data.dict['image_key'] = f'{self.set_code}_{scraped_data.dict["set_number"]:03d}'
+        #Save images, skipping any that are unchanged on the server, then store them once by content and make their variants
+        self._download_images(dict_list)
+        self._process_images(dict_list)
 
-        #UUID
-        scraped_data.dict['uuid'] = str(uuid4())
+        self._create_zip()
+        self._dump_metrics()
 
-        self.database.append(scraped_data)
+    def _save_replay(self) -> None:
+        """
+        Writes the records of the last replay() to <replay_dir>/<set_code>/data.json with the time and date each snapshot was fetched
+
+        The manifest, price history, per-card jsons and images are left alone, replayed prices are as old as their snapshots
+        """
+        fetched = self.snapshots.latest(self.replay_before)
+        latest = {}
+        for url, record in self.journal.entries():
+            latest[url] = record
+        replayed = []
+        differs = 0
+        for url, record in sorted(latest.items(), key=lambda item: item[1]['set_number']):
+            fetched_at = fetched[url]['fetched_at'] if url in fetched else None
+            replayed.append({
+                'url': url,
+                'fetched_at': fetched_at,
+                'scrape_date': datetime.date.fromtimestamp(fetched_at).isoformat() if fetched_at is not None else None,
+                'record': record,
+            })
+            saved = self.manifest.get(record['card_name'])
+            if saved is None or saved['sha256'] != record_hash(record):
+                differs += 1
+
+        file_path = os.path.join(self.replay_dir, self.set_code, self.json_filename)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        self._save_json_file(file_path, {'before': self.replay_before, 'records': replayed})
+        print(f"{self.set_code}: replayed {len(replayed)} records to {file_path}, {differs} differ from the saved records")
+        self.metrics.log('replay_saved', set_code=self.set_code, records=len(replayed), differs=differs, before=self.replay_before)
+        self._dump_metrics()
+
+    def _end_replay(self) -> None:
+        """
+        Points journal back at the set's own journal after a replay(), so scraping doesn't write into the replay output
+        """
+        if self.replaying:
+            self.replaying = False
+            self.replay_before = None
+            self.journal = ScrapeJournal(os.path.join(self.root_save_dir, self.set_code, self.journal_filename))
 
-    def save(self) -> None:
+    def _create_save_dirs(self) -> None:
         """
-        Saves data to raw_data.json and images to the images directory
+        Creates the set and image directories if they don't already exist
         """
-        #Create directories if they don't already exist
         if(not os.path.isdir(self.root_save_dir)):
             os.mkdir(self.root_save_dir)
         if(not os.path.isdir(self.root_save_dir + '/' + self.set_code)):
             os.mkdir(self.root_save_dir + '/' + self.set_code)
         if(not os.path.isdir(self.root_save_dir  + '/' + self.set_code + '/' + self.image_dir)):
             os.mkdir(self.root_save_dir + '/' + self.set_code + '/' + self.image_dir)
-        
-        #Save .json of all records
-        out_file = open(self.root_save_dir + '/' + self.set_code + '/' + self.json_filename, 'w')
 
-        #TODO: UPDATE JSON SAVING TO OPEN AND UPDATE/FILL IN MISSING RECORDS
-        dict_list = []  #List of dictionaries
-        for i in self.database:
-            dict_list.append(i.dict)
+    def _save_set_json(self, dict_list) -> None:
+        """
+        Merges records into data.json by image_key, so cards that were not scraped this run, e.g. ones the refresh scheduler skipped, keep their saved record
 
-        dict_list = sorted(dict_list, key=lambda k: k['set_number'])
+        Parameters
+        ----------
+        dict_list : list[dict]
+            Records scraped this run
+        """
+        file_path = self.root_save_dir + '/' + self.set_code + '/' + self.json_filename
+        with self.metrics.timer('json_write'):
+            saved = []
+            if exists(file_path):
+                try:
+                    with open(file_path, 'r') as f:
+                        saved = json.load(f)
+                except ValueError as err:
+                    print(f"Rewriting unreadable {file_path}: {err=}")
+            merged = {record['image_key']: record for record in saved}
+            merged.update((record['image_key'], record) for record in dict_list)
+            self._save_json_file(file_path, sorted(merged.values(), key=lambda k: k['set_number']))
+
+    def _diff_record(self, record) -> str:
+        """
+        Compares a record with its last saved version, ignoring the uuid, and returns 'new', 'changed' or 'unchanged'
 
-        json.dump(dict_list, out_file)
-        out_file.close()
+        An unchanged record is given the uuid it was saved with so data.json and RDS keep referring to the same row,
+        and its scrape time in the manifest is updated so the refresh scheduler counts it as fresh
 
-        #Save .json for individual records 
-        for dict in dict_list:
-            record_file_name = f'{dict["set_number"]:03d}.json' #Create the filename based on the set number with leading zeroes e.g. 001.json
-            out_file = open(self.root_save_dir + '/' + self.set_code + '/' + record_file_name , 'w')
-            json.dump(dict, out_file)
-            out_file.close()
-        
-        #Save image if it does not already exist
-        for i in self.database:
-            if(not exists(self.root_save_dir + '/' + self.set_code + '/' + self.image_dir + '/' + f'{i.dict["set_number"]:03d}.jpg')):        
-                with open(self.root_save_dir + '/' + self.set_code + '/' + self.image_dir + '/' + f'{i.dict["set_number"]:03d}.jpg', 'wb') as image_out:
-                    img_data = requests.get(i.dict['image_url']).content
-                    image_out.write(img_data)
-                    image_out.close()
+        Parameters
+        ----------
+        record : dict
+            The freshly scraped record
+        """
+        saved = self.manifest.get(record['card_name'])
+        if saved is None:
+            return 'new'
+        if saved['sha256'] != record_hash(record):
+            return 'changed'
+        if saved.get('uuid'):
+            record['uuid'] = saved['uuid']
+        self.manifest.touch(record['card_name'])
+        return 'unchanged'
+
+    def _print_change_summary(self) -> None:
+        """
+        Prints and logs how many records of the set were new, changed or unchanged
+        """
+        for change, count in self.change_summary.items():
+            self.metrics.increment('mtgscraper_records_total', count, change=change)
+        self.metrics.log('change_summary', set_code=self.set_code, **self.change_summary)
+        print(f"{self.set_code}: {self.change_summary['new']} new, {self.change_summary['changed']} changed, {self.change_summary['unchanged']} unchanged")
+
+    def _dump_metrics(self) -> None:
+        """
+        Writes the metrics to metrics_filename and logs the total time spent in each stage so far
+        """
+        try:
+            self.metrics.dump(self.metrics_filename)
+        except OSError as err:
+            print(f"Could not write {self.metrics_filename}: {err=}, {type(err)=}")
+        self.metrics.log('stage_totals', set_code=self.set_code, seconds=self.metrics.stage_totals())
+
+    def _save_record_json(self, record) -> str:
+        """
+        Saves a single record to NNN.json, adds it to the manifest and returns the path written to
+
+        Parameters
+        ----------
+        record : dict
+            The record to save
+        """
+        record_file_name = f'{record["set_number"]:03d}.json' #Create the filename based on the set number with leading zeroes e.g. 001.json
+        file_path = self.root_save_dir + '/' + self.set_code + '/' + record_file_name
+        with self.metrics.timer('json_write'):
+            self._save_json_file(file_path, record)     #Atomic, so a manifest rebuilt by another scraper never reads half a file
+        self.manifest.update(record)
+        return file_path
+
+    @staticmethod
+    def _load_json_file(file_path) -> dict:
+        """
+        Loads a json bookkeeping file, returning an empty dict if it is missing or unreadable
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the file to load
+        """
+        if not exists(file_path):
+            return {}
+        try:
+            with open(file_path, 'r') as f:
+                return json.load(f)
+        except ValueError as err:
+            print(f"Ignoring unreadable {file_path}: {err=}")
+            return {}
+
+    @staticmethod
+    def _save_json_file(file_path, data) -> None:
+        """
+        Atomically replaces a json file, leaving it and its modification time alone if its content wouldn't change
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the file to save
+        data : dict
+            Data to save
+        """
+        content = json.dumps(data)
+        if os.path.isfile(file_path) and os.path.getsize(file_path) == len(content.encode()):
+            with open(file_path, 'r') as f:
+                if f.read() == content:
+                    return
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(file_path)), delete=False) as f:
+            f.write(content)
+        os.replace(f.name, file_path)
+
+    def _is_bookkeeping(self, file_name) -> bool:
+        """
+        Returns whether a file in root_save_dir only holds local state, journals, the scrape manifest and caches, which is neither archived nor uploaded
+
+        Parameters
+        ----------
+        file_name : str
+            Path or name of the file
+        """
+        base_name = os.path.basename(file_name)
+        return (base_name in (self.journal_filename, self.manifest_filename, self.image_cache_filename, self.remote_cache_filename, self.failure_report_filename)
+                or fnmatch.fnmatch(base_name, self.worker_journal_pattern))
+
+    def _create_zip(self) -> None:
+        """
+        Brings the zip of the raw_data folder up to date
+
+        Only files that are new or changed since the last save, by size and modification time, are appended, so a save without changes leaves the zip as it is. 
+        Superseded members stay in the archive until they outnumber the live ones, at which point the zip is rebuilt from scratch. Bookkeeping files are left out
+        """
+        with shared_file_lock, self.metrics.timer('zip'):
+            self._update_zip()
+
+    def _update_zip(self) -> None:
+        """
+        Appends new or changed files to the zip or rebuilds it, called with shared_file_lock held
+        """
+        current = {}
+        for path, directories, files in os.walk(self.root_save_dir):
+            for file in files:
+                file_name = os.path.join(path, file)
+                if os.path.islink(file_name) or self._is_bookkeeping(file_name):   #Images are archived once from image_store
+                    continue
+                stat = os.stat(file_name)
+                current[file_name] = [stat.st_size, stat.st_mtime]
+
+        manifest = self._load_json_file(self.zip_manifest_filename)
+        members = manifest.get('members', {})
+        changed = [file_name for file_name, signature in current.items() if members.get(file_name) != signature]
+        stale = manifest.get('stale', 0) + sum(1 for file_name in members if file_name not in current or file_name in changed)
+
+        if not exists(self.zip_filename) or not members or stale > len(current):
+            if(self.debug):
+                print(f"Rebuilding {self.zip_filename} with {len(current)} files")
+            with ZipFile(self.zip_filename, 'w') as zip:
+                for file_name in current:
+                    self._write_zip_member(zip, file_name)
+            stale = 0
+        elif changed:
+            if(self.debug):
+                print(f"Appending {len(changed)} files to {self.zip_filename}")
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', UserWarning)    #Changed files are appended under the name they already have
+                with ZipFile(self.zip_filename, 'a') as zip:
+                    for file_name in changed:
+                        self._write_zip_member(zip, file_name)
+
+        self._save_json_file(self.zip_manifest_filename, {'members': current, 'stale': stale})
+
+    @staticmethod
+    def _write_zip_member(zip, file_name) -> None:
+        """
+        Writes a file to the zip, storing already compressed images as they are and deflating everything else
+
+        Parameters
+        ----------
+        zip : ZipFile
+            Archive to write to
+        file_name : str
+            Path of the file to add
+        """
+        if file_name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+            zip.write(file_name, compress_type=ZIP_STORED)
+        else:
+            zip.write(file_name, compress_type=ZIP_DEFLATED)
+
+    def _download_images(self, dict_list) -> None:
+        """
+        Downloads the image of every record concurrently through the shared session
+
+        Images we already hold locally with validators are requested conditionally and skipped when the server answers 304, 
+        images that exist locally without validators are left as they are and missing images are always downloaded in full
+
+        Parameters
+        ----------
+        dict_list : list[dict]
+            Records to download images for
+        """
+        image_path = os.path.join(self.root_save_dir, self.set_code, self.image_dir)
+        cache_path = os.path.join(image_path, self.image_cache_filename)
+        validators = self._load_json_file(cache_path)
+
+        self.image_timings = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            futures = {}
+            for record in dict_list:
+                image_filename = f'{record["set_number"]:03d}.jpg'
+                file_path = os.path.join(image_path, image_filename)
+                if exists(file_path) and image_filename not in validators:
+                    continue
+                #A 304 can't restore a deleted image or a dangling link into image_store
+                cached_validators = validators.get(image_filename) if exists(file_path) else None
+                future = executor.submit(self._download_image, record['image_url'], file_path, cached_validators)
+                futures[future] = image_filename
+
+            for future in as_completed(futures):
+                image_filename = futures[future]
+                try:
+                    elapsed, status, new_validators = future.result()
+                except BaseException as err:
+                    print(f"Could not download {image_filename}: {err=}, {type(err)=}")
+                    continue
+                if new_validators:
+                    validators[image_filename] = new_validators
+                self.image_timings.append((image_filename, elapsed, status))
+                self.metrics.observe('mtgscraper_stage_seconds', elapsed, stage='image_download')
+                self.metrics.increment('mtgscraper_images_total', status=status)
+                if(self.debug):
+                    print(f"IMAGE {image_filename} -> {status} in {elapsed:.3f}s")
+
+        self._save_json_file(cache_path, validators)
+
+        downloaded = sum(1 for t in self.image_timings if t[2] == 200)
+        print(f"Downloaded {downloaded}/{len(self.image_timings)} images in {time.perf_counter() - start:.2f}s")
+
+    def _process_images(self, dict_list) -> list:
+        """
+        Moves the set's downloaded images into image_store, makes any missing WebP variants on every core and updates the set's image manifest
 
-        #Create a zip of the raw_data folder
-        with ZipFile(self.zip_filename, 'w') as zip:
-            for path, directories, files in os.walk(self.root_save_dir):
-                for file in files:
-                    file_name = os.path.join(path, file)
-                    zip.write(file_name)
+        Parameters
+        ----------
+        dict_list : list[dict]
+            Records whose images to process
 
-    def run(self) -> None:
+        Returns
+        -------
+        list[str]
+            Paths of the stored objects, variants and image manifest of the set, for uploading
+        """
+        image_path = os.path.join(self.root_save_dir, self.set_code, self.image_dir)
+        manifest_path = os.path.join(image_path, self.image_manifest_filename)
+        file_paths = [os.path.join(image_path, f'{record["set_number"]:03d}.jpg') for record in dict_list]
+        with self.metrics.timer('image_process'):
+            entries = self.image_store.process([file_path for file_path in file_paths if os.path.lexists(file_path)])
+
+        manifest = self._load_json_file(manifest_path)
+        stored_files = []
+        for file_path, entry in entries.items():
+            manifest[os.path.basename(file_path)] = {
+                'sha256': entry['sha256'],
+                'object': self._s3_key(entry['object']),
+                'variants': {name: self._s3_key(path) for name, path in entry['variants'].items()},
+            }
+            stored_files.append(entry['object'])
+            stored_files.extend(entry['variants'].values())
+        self._save_json_file(manifest_path, manifest)
+        return sorted(set(stored_files)) + [manifest_path]
+
+    def _download_image(self, image_url, file_path, validators=None) -> tuple:
+        """
+        Streams one image to a temporary file next to file_path and atomically renames it into place
+
+        Parameters
+        ----------
+        image_url : str
+            URL of the image to download
+        file_path : str
+            Path to save the image to
+        validators : dict
+            ETag and Last-Modified values from the previous download of this image, if any
+
+        Returns
+        -------
+        tuple
+            Seconds taken, HTTP status code and the validators of the downloaded image
+        """
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        start = time.perf_counter()
+        with self.session.get(image_url, headers=headers, stream=True, timeout=self.delay) as response:
+            if response.status_code == 304:
+                return time.perf_counter() - start, 304, validators
+            response.raise_for_status()
+            with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(file_path), delete=False) as image_out:
+                try:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        image_out.write(chunk)
+                except BaseException:
+                    image_out.close()
+                    os.remove(image_out.name)
+                    raise
+            os.replace(image_out.name, file_path)
+            new_validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+        return time.perf_counter() - start, response.status_code, new_validators
+
+    def run(self, resume=False) -> None:
         """
         Starts the driver, and scrapes data for each card in cardlist txt      
+
+        A driver that has already handled cookies for an earlier set is reused without loading the base url again
+
+        Parameters
+        ----------
+        resume : bool
+            Continue from the journal of a previous run, skipping cards it already holds, instead of starting a new journal
         """
-        self._startup()
+        self._end_replay()
+        first_run = self.engine == "selenium" and not self.successfully_handled_cookies
+        if first_run:
+            self._startup()
 
         #Flow Control
         parse_only_one = False
         parse_first_x = 0
         random_parse = False
-        scrape_counter = 0
-        error_list = []
 
         self._create_url_list()
 
         #Load base website url and handle cookies
-        self._handle_cookies()
+        if first_run:
+            self._handle_cookies()
 
         #Scrape rest of data from urls generated from target list data
         url_head = self.url_base + self.url_mtg_section + self.url_set_name + "/"
 
+        if resume:
+            completed_urls = self.journal.completed_urls()
+            remaining = [c for c in self.formatted_card_list if url_head + c not in completed_urls]
+            print(f'Resuming: {len(self.formatted_card_list) - len(remaining)} cards already journaled')
+            self.formatted_card_list = remaining
+        else:
+            self.journal.reset()
+
         if parse_only_one:
             if random_parse:
-                self._scrape(url_head + random.choice(self.formatted_card_list))
+                self._scrape_card(url_head + random.choice(self.formatted_card_list))
             else:
-                self._scrape(url_head + self.formatted_card_list[247])
+                self._scrape_card(url_head + self.formatted_card_list[247])
         elif parse_first_x:
             if random_parse:
                 for i in range(parse_first_x):
-                    self._scrape(url_head + random.choice(self.formatted_card_list))
+                    self._scrape_card(url_head + random.choice(self.formatted_card_list))
             else:
                 for i in range(parse_first_x):
-                    self._scrape(url_head + self.formatted_card_list[i])   
+                    self._scrape_card(url_head + self.formatted_card_list[i])   
+        else:
+            self._scrape_with_retries(url_head)
+        self._dump_metrics()
+
+    def _scrape_with_retries(self, url_head) -> None:
+        """
+        Scrapes formatted_card_list, requeueing transient failures with exponential backoff until max_attempts is reached
+
+        Cards that still fail are written to the set's failure report with their failure category. 
+        Extra pool drivers are started once and kept for every attempt, so retries don't pay for driver startup and cookies again
+
+        Parameters
+        ----------
+        url_head : str
+            Url of the set on cardmarket that card names are appended to
+        """
+        failures = {}
+        card_list = self.formatted_card_list
+        pool_drivers = [None] * (self.worker_count - 1)
+        try:
+            self._scrape_attempts(card_list, url_head, failures, pool_drivers)
+        finally:
+            for driver in pool_drivers:
+                if driver is not None:
+                    driver.quit()
+
+        self._save_failure_report(failures)
+        print('Failed to scrape:')
+        for c, failure in failures.items():
+            print(f'{c} ({failure["category"]}, {failure["attempts"]} attempts): {failure["error"]}')
+
+    def _scrape_attempts(self, card_list, url_head, failures, pool_drivers) -> None:
+        """
+        Scrapes card_list, then retries its transient failures with exponential backoff up to max_attempts times
+
+        Parameters
+        ----------
+        card_list : list[str]
+            Cards in url format to scrape
+        url_head : str
+            Url of the set on cardmarket that card names are appended to
+        failures : dict
+            Collects the cards that could not be scraped
+        pool_drivers : list[webdriver]
+            Extra Selenium drivers of the pool, None where a driver hasn't been started yet
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1:
+                card_list = [c for c, failure in failures.items() if failure['category'] == 'transient']
+                if not card_list:
+                    break
+                backoff = self.retry_backoff * 2 ** (attempt - 2)
+                backoff += random.uniform(0, backoff / 2)
+                print(f'Retrying {len(card_list)} cards in {backoff:.0f}s (attempt {attempt}/{self.max_attempts})')
+                time.sleep(backoff)
+                for c in card_list:
+                    del failures[c]
+
+            if self.worker_count > 1:
+                print(f'Scraping {len(card_list)} cards with {self.worker_count} drivers')
+                self._run_pool(card_list, url_head, failures, attempt, pool_drivers)
+            else:
+                print(f'Scraping {len(card_list)} cards')
+                scrape_counter = 0
+                for c in card_list:
+                    scrape_counter += 1
+                    final_url = url_head + c      
+                    print(f'Scraping: {c} - {final_url}')   
+                    if(scrape_counter % 10 == 0):
+                        print(f'{scrape_counter}/{len(card_list)}')
+                    try:
+                        self._scrape_card(final_url)        
+                    except Exception as err:
+                        self._record_failure(failures, c, final_url, err, attempt)
+
+    @staticmethod
+    def _classify_failure(err) -> str:
+        """
+        Sorts a scraping error into "transient" (worth retrying), "not_found" or "parse_error"
+
+        Parameters
+        ----------
+        err : Exception
+            The error raised while scraping a card
+        """
+        if isinstance(err, PageNotFoundError):
+            return 'not_found'
+        if isinstance(err, NoSuchElementException):
+            return 'parse_error'    #The page loaded but is missing an element we read
+        if isinstance(err, (DriverDiedError, TimeoutException, StaleElementReferenceException, WebDriverException, requests.RequestException, urllib3.exceptions.HTTPError, ConnectionError, TimeoutError)):
+            return 'transient'
+        return 'parse_error'
+
+    def _record_failure(self, failures, c, final_url, err, attempt) -> None:
+        """
+        Classifies and records a card that could not be scraped
+
+        Parameters
+        ----------
+        failures : dict
+            Failures of the current run keyed by card
+        c : str
+            The card in url format
+        final_url : str
+            The url that was scraped
+        err : Exception
+            The error raised
+        attempt : int
+            Which attempt at the card failed
+        """
+        category = self._classify_failure(err)
+        print(f'Could not scrape {c} ({category}): \nUrl: {final_url}\nError: {err}\n')
+        self.metrics.increment('mtgscraper_failures_total', category=category)
+        self.metrics.log('scrape_failed', set_code=self.set_code, url=final_url, category=category, attempt=attempt, error=f'{type(err).__name__}: {err}')
+        with self.database_lock:
+            failures[c] = {'url': final_url, 'category': category, 'attempts': attempt, 'error': f'{type(err).__name__}: {err}'}
+
+    def _save_failure_report(self, failures) -> None:
+        """
+        Writes the cards that could not be scraped to the set's failure report, or removes a stale report when every card succeeded
+
+        Parameters
+        ----------
+        failures : dict
+            Failures of the current run keyed by card
+        """
+        report_path = os.path.join(self.root_save_dir, self.set_code, self.failure_report_filename)
+        if failures:
+            os.makedirs(os.path.dirname(report_path), exist_ok=True)
+            self._save_json_file(report_path, failures)
+        elif exists(report_path):
+            os.remove(report_path)
+
+    def _run_pool(self, card_list, url_head, failures, attempt, pool_drivers) -> None:
+        """
+        Scrapes card_list with worker_count drivers pulling card urls from a shared work queue
+
+        The scraper's own driver is used as the first worker. Extra drivers are taken from pool_drivers, 
+        a missing one is started and opens the base url and handles cookies once before taking work, and is kept in pool_drivers for later attempts
+
+        Parameters
+        ----------
+        card_list : list[str]
+            Cards in url format to scrape
+        url_head : str
+            Url of the set on cardmarket that card names are appended to
+        failures : dict
+            Collects the cards that could not be scraped
+        attempt : int
+            Which attempt at these cards this is
+        pool_drivers : list[webdriver]
+            Extra drivers from earlier attempts, None where a driver hasn't been started or has failed
+        """
+        work_queue = queue.Queue()
+        for c in card_list:
+            work_queue.put(c)
+        total = work_queue.qsize()
+        counter_lock = threading.Lock()
+        scrape_counter = [0]
+
+        def worker(driver) -> None:
+            while True:
+                try:
+                    c = work_queue.get_nowait()
+                except queue.Empty:
+                    return
+                final_url = url_head + c
+                print(f'Scraping: {c} - {final_url}')
+                try:
+                    self._scrape_card(final_url, driver)
+                except Exception as err:
+                    if driver is not None and not self._driver_alive(driver):
+                        work_queue.put(c)   #Not the card's fault, it goes to a working driver
+                        raise DriverDiedError(f"Browser session died on {final_url}: {type(err).__name__}: {err}")
+                    self._record_failure(failures, c, final_url, err, attempt)
+                with counter_lock:
+                    scrape_counter[0] += 1
+                    if(scrape_counter[0] % 10 == 0):
+                        print(f'{scrape_counter[0]}/{total}')
+
+        def quit_driver(driver) -> None:
+            try:
+                driver.quit()
+            except Exception:
+                pass    #Already dead
+
+        def own_worker() -> None:
+            for restart in range(self.driver_restarts + 1):
+                try:
+                    worker(self.driver)
+                    return
+                except DriverDiedError as err:
+                    print(f"{err}, restarting the driver")
+                    quit_driver(self.driver)
+                    self.driver = None
+                    try:
+                        self._ensure_driver()
+                    except BaseException as err:
+                        print(f"Could not restart the driver: {err=}, {type(err)=}")
+                        return
+
+        def extra_worker(slot) -> None:
+            for restart in range(self.driver_restarts + 1):
+                driver = pool_drivers[slot]
+                if driver is None:
+                    try:
+                        driver = self._create_driver()
+                    except BaseException as err:
+                        print(f"Could not start pool driver: {err=}, {type(err)=}")
+                        return
+                    try:
+                        self._geturl(self.url_base + '/en', driver)
+                        self._handle_cookies(driver)
+                    except BaseException as err:
+                        print(f"Pool driver failed: {err=}, {type(err)=}")
+                        quit_driver(driver)
+                        return
+                    pool_drivers[slot] = driver
+                try:
+                    worker(driver)
+                    return
+                except BaseException as err:
+                    print(f"Pool driver failed: {err=}, {type(err)=}")
+                    quit_driver(driver)
+                    pool_drivers[slot] = None   #Started afresh, now or on the next attempt
+
+        if self.engine == "http":
+            #Http workers share the session and only take driver_lock when a page needs a browser
+            threads = [threading.Thread(target=worker, args=(None,)) for _ in range(self.worker_count)]
         else:
-            print(f'Scraping {len(self.formatted_card_list)} cards')
-            for c in self.formatted_card_list:
-                scrape_counter += 1
-                final_url = url_head + c      
-                print(f'Scraping: {c} - {final_url}')   
-                if(scrape_counter % 10 == 0):
-                    print(f'{scrape_counter}/{len(self.formatted_card_list)}')
+            threads = [threading.Thread(target=own_worker)]
+            threads += [threading.Thread(target=extra_worker, args=(slot,)) for slot in range(len(pool_drivers))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        #Cards left when every driver gave up are retried on the next attempt
+        while not work_queue.empty():
+            c = work_queue.get_nowait()
+            self._record_failure(failures, c, url_head + c, DriverDiedError("No working driver left"), attempt)
+
+    def _create_work_queue(self) -> WorkQueue:
+        """
+        Connects to the work queue in the RDS database, creating its table if needed
+        """
+        work_queue = WorkQueue(create_engine(self.database_access), self.task_table_name, self.task_lease_seconds, self.max_attempts)
+        work_queue.create()
+        return work_queue
+
+    def enqueue(self, work_queue=None) -> None:
+        """
+        Adds the cards of the current set to the distributed work queue, so any scraper calling run_queue() can claim them
+
+        Parameters
+        ----------
+        work_queue : WorkQueue
+            Queue to add to, defaults to the queue in the RDS database
+        """
+        own_queue = work_queue is None
+        if own_queue:
+            work_queue = self._create_work_queue()
+        try:
+            self.formatted_card_list = []
+            self._create_url_list()
+            work_queue.enqueue(self.set_code, self.url_set_name, self.formatted_card_list)
+            print(f'Queued {len(self.formatted_card_list)} cards of {self.set_code}')
+        finally:
+            if own_queue:
+                work_queue.engine.dispose()
+
+    def run_queue(self, work_queue=None, worker_id=None, batch_size=10) -> None:
+        """
+        Claims cards from the distributed work queue and scrapes them until none are left or leased to other scrapers, then saves, and uploads if to_upload is set, every set it scraped
+
+        Claimed cards are leased to this scraper and their leases are extended from a heartbeat thread while it works, 
+        so cards of a scraper that crashes are claimed again by another once their lease expires.
+        Each scraper journals to its own journal-<worker_id>.jsonl and a set is saved from every worker journal in its directory, 
+        so scrapers sharing a directory don't lose each other's records and a restarted scraper saves the cards a crashed one had finished.
+        Saves of a set are serialised between the scrapers of a process and a set whose journals another scraper already saved is skipped.
+        The journal of run() is left alone
+
+        Parameters
+        ----------
+        work_queue : WorkQueue
+            Queue to claim from, defaults to the queue in the RDS database
+        worker_id : str
+            Unique id of this scraper in the queue, defaults to host name, process id and a random suffix
+        batch_size : int
+            Number of cards claimed at a time
+        """
+        self._end_replay()
+        own_queue = work_queue is None
+        if own_queue:
+            work_queue = self._create_work_queue()
+        worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:8]}'
+        if self.engine == "selenium" and not self.successfully_handled_cookies:
+            self._startup()
+            self._handle_cookies()
+
+        held = set()
+        held_lock = threading.Lock()
+        stop = threading.Event()
+
+        def heartbeat() -> None:
+            while not stop.wait(work_queue.lease_seconds / 3):
+                with held_lock:
+                    task_ids = list(held)
                 try:
-                    self._scrape(final_url)        
+                    work_queue.heartbeat(worker_id, task_ids)
                 except BaseException as err:
-                    err_message = f'Could not scrape {c}): \nUrl: {final_url}\nError: {err}\n'
-                    print(err_message)
-                    error_list.append(err_message)
-        
-        print('Failed to scrape:')
-        for err_message in error_list:
-            print(err_message)
+                    print(f"Heartbeat failed: {err=}, {type(err)=}")
+
+        #Sets journaled by an earlier run that stopped before saving them, the set slug is read back from the journaled url
+        scraped_sets = {}
+        for journal_path in glob.glob(os.path.join(self.root_save_dir, '*', self.worker_journal_pattern)):
+            for url, record in ScrapeJournal(journal_path).entries():
+                scraped_sets[os.path.basename(os.path.dirname(journal_path))] = url.rstrip('/').split('/')[-2]
+                break
+        worker_journal_filename = self.worker_journal_pattern.replace('*', worker_id)
+        journal_set = None
+
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+        try:
+            while True:
+                #Prefer cards of the set already loaded so sets aren't switched back and forth
+                tasks = work_queue.claim(worker_id, batch_size, self.set_code) or work_queue.claim(worker_id, batch_size)
+                if not tasks:
+                    if not work_queue.counts().get(LEASED):
+                        break
+                    time.sleep(min(work_queue.lease_seconds / 3, 10))   #Other scrapers still hold cards, which come back if they crash
+                    continue
+                with held_lock:
+                    held.update(task['id'] for task in tasks)
+                for task in tasks:
+                    if task['set_code'] != journal_set:
+                        self.retarget(task['set_slug'], task['set_code'], self.target_list_filepath)
+                        self.journal = ScrapeJournal(os.path.join(self.root_save_dir, self.set_code, worker_journal_filename))
+                        journal_set = self.set_code
+                    scraped_sets[task['set_code']] = task['set_slug']
+                    url = self.url_base + self.url_mtg_section + task['set_slug'] + '/' + task['card_slug']
+                    print(f'Scraping: {task["card_slug"]} - {url} (attempt {task["attempts"]})')
+                    try:
+                        self._scrape_card(url)
+                    except Exception as err:
+                        category = self._classify_failure(err)
+                        self._record_failure({}, task['card_slug'], url, err, task['attempts'])
+                        work_queue.fail(worker_id, task['id'], f'{category}: {type(err).__name__}: {err}', retry=category == 'transient')
+                    else:
+                        if not work_queue.complete(worker_id, task['id']):
+                            print(f'Lost the lease on {task["card_slug"]} to another scraper')
+                    finally:
+                        with held_lock:
+                            held.discard(task['id'])
+        finally:
+            stop.set()
+            heartbeat_thread.join()
+            if own_queue:
+                work_queue.engine.dispose()
+
+        for set_code, set_slug in scraped_sets.items():
+            with set_save_lock(set_code):
+                journal_mtimes = {}
+                for journal_path in glob.glob(os.path.join(self.root_save_dir, set_code, self.worker_journal_pattern)):
+                    try:
+                        journal_mtimes[journal_path] = os.path.getmtime(journal_path)
+                    except FileNotFoundError:
+                        continue    #Saved and removed by another scraper
+                if not journal_mtimes:
+                    continue
+                self.retarget(set_slug, set_code, self.target_list_filepath)
+                latest = {}
+                for journal_path in sorted(journal_mtimes, key=journal_mtimes.get):
+                    for url, record in ScrapeJournal(journal_path).entries():
+                        latest[url] = record
+                self.save(sorted(latest.values(), key=lambda k: k['set_number']))
+                if self.to_upload:
+                    self.upload()
+
+                #Every journal read above is saved now, unless its scraper has written to it since
+                for journal_path, mtime in journal_mtimes.items():
+                    try:
+                        if os.path.getmtime(journal_path) == mtime:
+                            os.remove(journal_path)
+                    except FileNotFoundError:
+                        pass
+        print(f'Queue empty, scraped cards of {len(scraped_sets)} sets')
+        self._dump_metrics()
+
+    def run_pipeline(self, resume=False, queue_size=50, batch_size=25) -> None:
+        """
+        Scrapes, saves and uploads the set as a streaming pipeline
+
+        Records flow from the scrape workers through bounded queues to a persist stage, which writes each NNN.json and image as soon as the record arrives, 
+        and an upload stage, which pushes batches to S3 and RDS when to_upload is set. Full queues block the stage before them so memory stays bounded by the queue sizes.
+
+        Parameters
+        ----------
+        resume : bool
+            Continue from the journal of a previous run, its records that were not saved yet are persisted and uploaded before new cards are scraped
+        queue_size : int
+            Maximum number of records waiting between two stages
+        batch_size : int
+            Number of records uploaded to S3 and RDS together
+        """
+        self._end_replay()
+        self._create_save_dirs()
+        self.changed_records = []
+        self.change_summary = {'new': 0, 'changed': 0, 'unchanged': 0}
+        self.record_queue = queue.Queue(maxsize=queue_size)
+        upload_queue = queue.Queue(maxsize=queue_size) if self.to_upload else None
+
+        stages = [threading.Thread(target=self._persist_stage, args=(upload_queue,))]
+        if upload_queue is not None:
+            stages.append(threading.Thread(target=self._upload_stage, args=(upload_queue, batch_size)))
+        for stage in stages:
+            stage.start()
+
+        try:
+            if resume:
+                #Records journaled before the crash skip the scrape, so they are streamed through persist and upload first, unchanged ones are dropped there
+                for record in self.journal.records():
+                    self.record_queue.put(record)
+            self.run(resume)
+        finally:
+            self.record_queue.put(None)
+            for stage in stages:
+                stage.join()
+            self.record_queue = None
+
+        #Set level outputs need every record so they are built from the journal once streaming has finished
+        dict_list = self.journal.records()
+        for dict in dict_list:
+            self._diff_record(dict) #Unchanged records take the uuid they were saved with
+        if self.changed_records or not exists(self.root_save_dir + '/' + self.set_code + '/' + self.json_filename):
+            self._save_set_json(dict_list)
+        self._print_change_summary()
+        price_history.write_partition(dict_list, self.history_dir, self.set_code)
+        image_files = self._process_images(dict_list)
+        self._create_zip()
+        if self.to_upload:
+            self._upload_s3_files(image_files + [self.root_save_dir + '/' + self.set_code + '/' + self.json_filename, self.upload_file_name])
+        self._dump_metrics()
+
+    def _persist_stage(self, upload_queue) -> None:
+        """
+        Pipeline stage saving the json and image of each new or changed record taken from record_queue, unchanged records are counted and dropped
+
+        Parameters
+        ----------
+        upload_queue : queue.Queue
+            Queue saved records and their files are passed on to, None when not uploading
+        """
+        image_path = os.path.join(self.root_save_dir, self.set_code, self.image_dir)
+        cache_path = os.path.join(image_path, self.image_cache_filename)
+        validators = self._load_json_file(cache_path)
+        while True:
+            record = self.record_queue.get()
+            if record is None:
+                break
+            change = self._diff_record(record)
+            self.change_summary[change] += 1
+            if change == 'unchanged':
+                continue
+            self.changed_records.append(record)
+            try:
+                files = [self._save_record_json(record)]
+                image_filename = f'{record["set_number"]:03d}.jpg'
+                image_file_path = os.path.join(image_path, image_filename)
+                #Same rules as _download_images, so images saved here are revalidated by later runs
+                if not exists(image_file_path) or image_filename in validators:
+                    cached_validators = validators.get(image_filename) if exists(image_file_path) else None
+                    elapsed, status, new_validators = self._download_image(record['image_url'], image_file_path, cached_validators)
+                    if new_validators:
+                        validators[image_filename] = new_validators
+                    self.metrics.observe('mtgscraper_stage_seconds', elapsed, stage='image_download')
+                    self.metrics.increment('mtgscraper_images_total', status=status)
+                files.append(self.image_store.ingest(image_file_path))
+            except BaseException as err:
+                print(f"Could not save {record.get('card_name')}: {err=}, {type(err)=}")
+                continue
+            if upload_queue is not None:
+                upload_queue.put((record, files))
+        self._save_json_file(cache_path, validators)
+        self.manifest.save()
+        if upload_queue is not None:
+            upload_queue.put(None)
+
+    def _upload_stage(self, upload_queue, batch_size) -> None:
+        """
+        Pipeline stage uploading saved records to S3 and RDS in batches
+
+        Parameters
+        ----------
+        upload_queue : queue.Queue
+            Queue of (record, files) tuples from the persist stage
+        batch_size : int
+            Number of records uploaded together
+        """
+        engine = create_engine(self.database_access)
+        batch = []
+        done = False
+        try:
+            while not done:
+                item = upload_queue.get()
+                if item is None:
+                    done = True
+                else:
+                    batch.append(item)
+                if batch and (done or len(batch) >= batch_size):
+                    try:
+                        self._upload_s3_files([f for record, files in batch for f in files])
+                        self._upload_rds(pd.DataFrame.from_records([MTGCardData.from_dict(record).to_tuple() for record, files in batch], columns=MTGCardData.FIELDS), engine)
+                    except BaseException as err:
+                        print(f"Could not upload batch of {len(batch)} records: {err=}, {type(err)=}")
+                    batch = []
+        finally:
+            engine.dispose()
 
     def upload(self) -> None:
         """
         Uploads the raw_data folder(zipped) to AWS S3 and creates a dataframe for each record and then uploads to AWS RDS
+
+        Does nothing after a replay(), its prices are only as recent as the snapshots
         """
+        if self.replaying:
+            print(f"{self.set_code}: not uploading replayed records")
+            return
 
         #Create S3 connection
         self._upload_s3()
 
-        #Create RDS connection
+        #Create RDS connection, only new or changed records are upserted
         self._create_dataframe()
-        self._upload_rds()
+        if self.dataframe.empty:
+            print("No changed records to upload to RDS")
+        else:
+            self._upload_rds()
+        self._dump_metrics()
 
     def _upload_s3(self) -> bool:
         """
-        Upload the raw_data.zip to S3
+        Upload the raw_data.zip and the files of raw_data to S3, leaving out bookkeeping files
+        """
+        file_paths = []
+        for root,dirs,files in os.walk(self.root_save_dir):
+            for file in files:
+                if not os.path.islink(os.path.join(root,file)) and not self._is_bookkeeping(file):  #Images are uploaded once from image_store
+                    file_paths.append(os.path.join(root,file))
+        file_paths.append(self.upload_file_name)
+        return self._upload_s3_files(file_paths)
+
+    def _s3_key(self, file_path) -> str:
+        """
+        Returns the S3 key of a file, files in root_save_dir keep their set prefix e.g. NEO/images/001.jpg
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the file to upload
+        """
+        relative_path = os.path.relpath(file_path, self.root_save_dir)
+        if relative_path.startswith('..'):
+            return os.path.basename(file_path)
+        return relative_path.replace(os.sep, '/')
+
+    def _upload_s3_files(self, file_paths) -> bool:
+        """
+        Syncs the given files to S3, skipping any whose content hash matches the manifest
+
+        Changed files are uploaded concurrently, with large files split into multipart uploads. 
+        Files whose size and modification time match the manifest are not re-hashed
+
+        Parameters
+        ----------
+        file_paths : list[str]
+            Paths of the files to upload
         """
         s3_client = boto3.client('s3')
+        transfer_config = TransferConfig(multipart_threshold=8 * 1024 * 1024, max_concurrency=4)
         try:
-            for root,dirs,files in os.walk(self.root_save_dir):
-                for file in files:
-                    s3_client.upload_file(os.path.join(root,file),self.bucket_name,file)
+            with self.metrics.timer('s3_upload'):
+                #The shared manifest is only locked while it is read and merged, so other scrapers can upload at the same time
+                with shared_file_lock:
+                    manifest = self._load_json_file(self.s3_manifest_filename)
+                updates = {}
+                to_upload = []
+                for file_path in file_paths:
+                    key = self._s3_key(file_path)
+                    stat = os.stat(file_path)
+                    entry = manifest.get(key)
+                    if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                        continue
+                    sha = file_hash(file_path)
+                    if entry and entry['sha256'] == sha:
+                        updates[key] = {'sha256': sha, 'size': stat.st_size, 'mtime': stat.st_mtime}
+                        continue
+                    to_upload.append((file_path, key, {'sha256': sha, 'size': stat.st_size, 'mtime': stat.st_mtime}))
 
-            response = s3_client.upload_file(self.upload_file_name, self.bucket_name, self.upload_file_name)
-            print("Uploaded to S3 successfully")
+                try:
+                    with ThreadPoolExecutor(max_workers=self.s3_upload_workers) as executor:
+                        futures = {executor.submit(s3_client.upload_file, file_path, self.bucket_name, key, Config=transfer_config): (key, entry)
+                                   for file_path, key, entry in to_upload}
+                        for future in as_completed(futures):
+                            future.result()
+                            key, entry = futures[future]
+                            updates[key] = entry
+                finally:
+                    if updates:
+                        with shared_file_lock:
+                            manifest = self._load_json_file(self.s3_manifest_filename)
+                            manifest.update(updates)
+                            self._save_json_file(self.s3_manifest_filename, manifest)
+            self.metrics.increment('mtgscraper_s3_files_total', len(to_upload), result='uploaded')
+            self.metrics.increment('mtgscraper_s3_files_total', len(file_paths) - len(to_upload), result='unchanged')
+            print(f"Uploaded {len(to_upload)} changed files to S3, {len(file_paths) - len(to_upload)} unchanged")
         except FileNotFoundError:
-            if(debug):
+            if(self.debug):
                 print("The file was not found")
             return False
         except NoCredentialsError:
-            if(debug):
+            if(self.debug):
                 print("Credentials not available")
             return False
         except ClientError as e:
-            if(debug):
+            if(self.debug):
                 print(f"Client Error: {e=}, {type(e)=}")
             return False
         return True
 
 
-    def _upload_rds(self) -> bool:
+    def _upload_rds(self, dataframe=None, engine=None) -> bool:
         """
-        Upload the tabulated data to the RDS instance
+        Upsert the tabulated data into the RDS instance
+
+        Rows are bulk loaded in rds_chunksize batches into a staging table and then merged into table_name on image_key 
+        in the same transaction, so re-uploading a set updates its rows instead of duplicating them
+
+        Parameters
+        ----------
+        dataframe : pd.DataFrame
+            Data to upload, defaults to the dataframe made by _create_dataframe()
+        engine : sqlalchemy.engine.Engine
+            Engine to upload with, a new one is created and disposed of if not given
         """
-        
+        if dataframe is None:
+            dataframe = self.dataframe
+        own_engine = engine is None
+        if own_engine:
+            engine = create_engine(self.database_access)
+
+        if 'set_code' not in dataframe.columns:
+            dataframe = dataframe.assign(set_code=self.set_code)
+        columns = [c for c in RDS_DTYPES if c in dataframe.columns]
+        dataframe = dataframe[columns].drop_duplicates(subset='image_key', keep='last')
+        staging_table = f'{self.table_name}_staging_{uuid4().hex[:8]}'
+        column_list = ', '.join(columns)
+        update_list = ', '.join(f'{c} = excluded.{c}' for c in columns if c != 'image_key')
 
-        engine = create_engine(self.database_access)
-        engine.connect()
-        self.dataframe.to_sql('mtgscraper_dataset', engine, if_exists='append')
+        try:
+            with self.metrics.timer('rds_upload'), engine.begin() as connection:
+                self._ensure_rds_table(connection)
+                dataframe.to_sql(staging_table, connection, if_exists='replace', index=False,
+                                 dtype={c: RDS_DTYPES[c] for c in columns}, chunksize=self.rds_chunksize)
+                connection.execute(text(
+                    f'INSERT INTO {self.table_name} ({column_list}) SELECT {column_list} FROM {staging_table} WHERE true '
+                    f'ON CONFLICT (image_key) DO UPDATE SET {update_list}'))
+                connection.execute(text(f'DROP TABLE {staging_table}'))
+            self.metrics.increment('mtgscraper_rds_rows_total', len(dataframe))
+            if(self.debug):
+                print(f"Upserted {len(dataframe)} rows into {self.table_name}")
+
+            #Keep a fresh cache of names in RDS in step with what was just uploaded
+            cache = self._load_json_file(self._remote_cache_path())
+            if cache:
+                names = set(cache['names'])
+                names.update(dataframe.loc[dataframe['set_code'] == self.set_code, 'card_name'])
+                cache['names'] = sorted(names)
+                self._save_json_file(self._remote_cache_path(), cache)
+        finally:
+            if own_engine:
+                engine.dispose()
+        return True
 
-        engine.dispose()
-        pass
+    def _ensure_rds_table(self, connection) -> None:
+        """
+        Creates table_name with the RDS_DTYPES schema if it doesn't exist, makes sure image_key is unique and set_code is indexed
+
+        Tables created by earlier appending uploads are deduplicated first, keeping the last inserted row of each image_key, 
+        and given a set_code column which is filled in from image_key for the current set.
+        Only called before uploading, every statement is IF NOT EXISTS so nodes migrating at the same time don't fail on each other
+
+        Parameters
+        ----------
+        connection : sqlalchemy.engine.Connection
+            Connection inside the current transaction
+        """
+        metadata = MetaData()
+        table = Table(self.table_name, metadata, *[Column(name, dtype) for name, dtype in RDS_DTYPES.items()])
+        connection.execute(CreateTable(table, if_not_exists=True))
+
+        inspector = inspect(connection)
+        if connection.dialect.name == 'postgresql':
+            #Another scraper may add the column between the inspection and the ALTER, IF NOT EXISTS makes that a no-op
+            connection.execute(text(f'ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS set_code TEXT'))
+        elif 'set_code' not in [column['name'] for column in inspector.get_columns(self.table_name)]:
+            connection.execute(text(f'ALTER TABLE {self.table_name} ADD COLUMN set_code TEXT'))
+        index_names = [index['name'] for index in inspector.get_indexes(self.table_name)]
+
+        image_key_index = f'{self.table_name}_image_key_idx'
+        if image_key_index not in index_names:
+            #uuids are random, so the physical row id is what orders rows by insertion
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text(
+                    f'DELETE FROM {self.table_name} older USING {self.table_name} newer '
+                    f'WHERE older.image_key = newer.image_key AND older.ctid < newer.ctid'))
+            else:
+                connection.execute(text(
+                    f'DELETE FROM {self.table_name} WHERE rowid NOT IN '
+                    f'(SELECT MAX(rowid) FROM {self.table_name} GROUP BY image_key)'))
+            connection.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS {image_key_index} ON {self.table_name} (image_key)'))
+
+        set_code_index = f'{self.table_name}_set_code_idx'
+        if set_code_index not in index_names:
+            connection.execute(text(f'CREATE INDEX IF NOT EXISTS {set_code_index} ON {self.table_name} (set_code, card_name)'))
+
+        connection.execute(
+            text(f"UPDATE {self.table_name} SET set_code = :set_code WHERE set_code IS NULL AND image_key LIKE :prefix ESCAPE '!'"),
+            {'set_code': self.set_code, 'prefix': f'{self.set_code}!_%'})
 
     def _create_dataframe(self) -> None:
         """
-        Create dataframe with pandas
+        Create dataframe with pandas from the records changed by the last save(), or from data.json if nothing has been saved by this scraper
         """
-        self.dataframe = pd.read_json(self.root_save_dir + '/' + self.set_code + '/' + self.json_filename)
+        if self.changed_records is not None:
+            records = [MTGCardData.from_dict(record).to_tuple() for record in self.changed_records]
+        else:
+            with open(self.root_save_dir + '/' + self.set_code + '/' + self.json_filename, 'r') as f:
+                records = [MTGCardData.from_dict(record).to_tuple() for record in json.load(f)]
+        self.dataframe = pd.DataFrame.from_records(records, columns=MTGCardData.FIELDS)
         if(self.debug):
             print(self.dataframe.head)
 
@@ -550,9 +2086,11 @@ if __name__ == "__main__":
     bucket_name = "mtgscraperbucket"
     rds_endpoint = "testaidb.czu22ftu6upt.eu-west-2.rds.amazonaws.com"
     local_target_list = False
+    worker_count = 1
+    engine = "selenium"
     
 
-    scraper = Scraper(target_url, set_name, set_code, local_target_list, target_list_filepath, to_upload, upload_file_name, bucket_name, rds_endpoint, debug)
+    scraper = Scraper(target_url, set_name, set_code, local_target_list, target_list_filepath, to_upload, upload_file_name, bucket_name, rds_endpoint, debug, worker_count, engine)
     scraper.run()
     #scraper.save()
     #scraper.close()
@@ -0,0 +1,119 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+class SnapshotStore:
+    """
+    Compressed, content-addressed archive of fetched product pages, so extraction can be re-run without the network
+
+    Page bodies are stored once per distinct content as <root>/blobs/ab/abcd....html.gz, an unchanged page fetched on many days takes no extra space.
+    Each fetch is recorded as a line of <root>/index/<index_name>.jsonl with its url, final url, fetch time and content hash
+
+    Parameters
+    ----------
+    root_dir : str
+        Directory of the store
+    index_name : str
+        Name of the index fetches are recorded in, e.g. the set code
+
+    Attributes
+    ----------
+    root_dir : str
+        Directory of the store
+    index_path : str
+        Path of the index file
+    lock : threading.Lock
+        Serialises index appends from concurrent scrape workers
+    """
+
+    def __init__(self, root_dir, index_name) -> None:
+        self.root_dir = root_dir
+        self.index_path = os.path.join(root_dir, 'index', f'{index_name}.jsonl')
+        self.lock = threading.Lock()
+
+    def blob_path(self, sha) -> str:
+        """
+        Returns where the compressed page with the given sha256 is stored
+        """
+        return os.path.join(self.root_dir, 'blobs', sha[:2], f'{sha}.html.gz')
+
+    def put(self, url, content, final_url=None, fetched_at=None) -> str:
+        """
+        Stores a fetched page and records the fetch in the index
+
+        Parameters
+        ----------
+        url : str
+            The requested url
+        content : bytes
+            Body of the page
+        final_url : str
+            Url the page was served from after redirects, defaults to url
+        fetched_at : float
+            Unix time of the fetch, defaults to now
+
+        Returns
+        -------
+        str
+            sha256 of the page
+        """
+        sha = hashlib.sha256(content).hexdigest()
+        blob_path = self.blob_path(sha)
+        if not os.path.isfile(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(blob_path), delete=False) as out_file:
+                out_file.write(gzip.compress(content, compresslevel=6))
+            os.replace(out_file.name, blob_path)
+
+        line = json.dumps({'url': url, 'final_url': final_url or url, 'fetched_at': fetched_at or time.time(), 'sha256': sha}) + '\n'
+        with self.lock:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            with open(self.index_path, 'a') as f:
+                f.write(line)
+        return sha
+
+    def get(self, sha) -> bytes:
+        """
+        Returns the body of the page with the given sha256
+
+        Parameters
+        ----------
+        sha : str
+            sha256 of the page
+        """
+        with open(self.blob_path(sha), 'rb') as f:
+            return gzip.decompress(f.read())
+
+    def entries(self):
+        """
+        Yields the index entry of every recorded fetch in the order they were made, skipping a partially written final line
+        """
+        if not os.path.isfile(self.index_path):
+            return
+        with open(self.index_path, 'r') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def latest(self, before=None) -> dict:
+        """
+        Returns url -> index entry of the most recent fetch of each page
+
+        Parameters
+        ----------
+        before : float
+            Only consider fetches made at or before this unix time, to replay the corpus as it was at that point
+        """
+        latest = {}
+        for entry in self.entries():
+            if before is not None and entry['fetched_at'] > before:
+                continue
+            if entry['url'] not in latest or entry['fetched_at'] >= latest[entry['url']]['fetched_at']:
+                latest[entry['url']] = entry
+        return latest
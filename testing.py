@@ -1,12 +1,30 @@
 import scraper 
+import json_parser
+import card_extraction
 import unittest
 import hypothesis
 import os
 import urllib3.exceptions
 import json
+import time
+import tempfile
+import shutil
+import multiprocessing
+import contextlib
+import io
+import re
+import pandas as pd
 from sqlalchemy import create_engine
 from sqlalchemy import inspect
+from sqlalchemy import text
+from lxml import html
+from mtg_card_data import MTGCardData
+from work_queue import WorkQueue, LEASED, DONE
+from benchmark import FixtureServer, synthetic_pages
+from rate_limiter import RateLimiter
 import boto3
+from unittest import mock
+from moto import mock_aws
 from botocore.exceptions import NoCredentialsError
 from botocore.exceptions import ClientError
 
@@ -19,6 +37,30 @@ def parse_json(filename):
             print('invalid json: %s' % e) 
             return None
 
+def queue_worker(database_path, worker_id, lease_seconds):
+    """
+    Claims and completes tasks from the SQLite work queue until none are pending or leased, run in its own process
+
+    Returns the card slugs this worker completed
+    """
+    engine = create_engine(f"sqlite:///{database_path}", connect_args={'timeout': 30})
+    work_queue = WorkQueue(engine, lease_seconds=lease_seconds)
+    completed = []
+    try:
+        while True:
+            tasks = work_queue.claim(worker_id, limit=2)
+            if not tasks:
+                if work_queue.counts().get(LEASED):
+                    time.sleep(lease_seconds / 4)    #Wait for the leases of a crashed worker to expire
+                    continue
+                break
+            for task in tasks:
+                if work_queue.complete(worker_id, task['id']):
+                    completed.append(task['card_slug'])
+    finally:
+        engine.dispose()
+    return completed
+
 class ScraperTestCase(unittest.TestCase):
 
     """
@@ -43,13 +85,14 @@ class ScraperTestCase(unittest.TestCase):
         set_name = "Kamigawa-Neon-Dynasty"
         set_code = "NEO"
         debug = True
+        local_target_list = True
         to_upload = False
         upload_file_name = "raw_data.zip"
         bucket_name = "mtgscraperbucket"
         rds_endpoint = "testaidb.czu22ftu6upt.eu-west-2.rds.amazonaws.com"
     
 
-        self.scraper = scraper.Scraper(target_url, set_name, set_code, target_list_filepath, to_upload, upload_file_name, bucket_name, rds_endpoint, debug)
+        self.scraper = scraper.Scraper(target_url, set_name, set_code, local_target_list, target_list_filepath, to_upload, upload_file_name, bucket_name, rds_endpoint, debug)
         self.scraper.run()
         self.running_id = self.scraper.driver.session_id
         self.scraper.save()
@@ -77,7 +120,7 @@ class ScraperTestCase(unittest.TestCase):
         """
         Check for any discrepancies between the urls the driver was told to request and those that it visited
         """
-        self.assertListEqual(self.scraper.get_url_log, self.scraper.driver_url_log, 'URL Log discrepancy') #Check the urls the driver accessed are the same as the target urls
+        self.assertListEqual(list(self.scraper.get_url_log), list(self.scraper.driver_url_log), 'URL Log discrepancy') #Check the urls the driver accessed are the same as the target urls
 
     def test_save(self) -> None:
         """
@@ -142,5 +185,528 @@ class ScraperTestCase(unittest.TestCase):
 
         pass
 
+class WorkQueueTestCase(unittest.TestCase):
+
+    """
+    Offline tests of the work queue against a SQLite stand-in for RDS
+
+    Attributes
+    ----------
+    work_dir : str
+        Temporary directory holding the database
+    database_path : str
+        Path of the SQLite database
+    engine : sqlalchemy.engine.Engine
+        Engine of the database
+    card_slugs : list[str]
+        Cards put on the queue
+    """
+    def setUp(self) -> None:
+        """
+        Create an empty queue in a temporary SQLite database
+        """
+        self.work_dir = tempfile.mkdtemp()
+        self.database_path = os.path.join(self.work_dir, 'queue.db')
+        self.engine = create_engine(f"sqlite:///{self.database_path}", connect_args={'timeout': 30})
+        self.card_slugs = [f'Card-{i:03d}' for i in range(40)]
+
+    def tearDown(self) -> None:
+        """
+        Delete the database
+        """
+        self.engine.dispose()
+        shutil.rmtree(self.work_dir)
+
+    def test_processes_complete_every_task_once(self) -> None:
+        """
+        Several processes draining the queue, after a worker crashed holding leases, complete every card exactly once
+        """
+        lease_seconds = 1
+        work_queue = WorkQueue(self.engine, lease_seconds=lease_seconds)
+        work_queue.create()
+        work_queue.enqueue('NEO', 'Kamigawa-Neon-Dynasty', self.card_slugs)
+        crashed = work_queue.claim('crashed-worker', limit=5)   #Never completed, as if the process died
+        self.assertEqual(len(crashed), 5)
+
+        with multiprocessing.get_context('spawn').Pool(3) as pool:
+            results = pool.starmap(queue_worker, [(self.database_path, f'worker-{i}', lease_seconds) for i in range(3)])
+
+        completed = [card_slug for result in results for card_slug in result]
+        self.assertEqual(len(completed), len(self.card_slugs), 'A card was completed more than once or not at all')
+        self.assertCountEqual(completed, self.card_slugs)
+        self.assertEqual(work_queue.counts(), {DONE: len(self.card_slugs)})
+
+    def test_expired_lease_is_reclaimed(self) -> None:
+        """
+        A task whose lease expires is claimed by another worker, and the original holder can no longer complete it
+        """
+        work_queue = WorkQueue(self.engine, lease_seconds=0.2)
+        work_queue.create()
+        work_queue.enqueue('NEO', 'Kamigawa-Neon-Dynasty', self.card_slugs[:1])
+
+        first = work_queue.claim('worker-a')
+        self.assertEqual(len(first), 1)
+        self.assertEqual(work_queue.claim('worker-b'), [], 'A leased task was claimed twice')
+        time.sleep(0.3)
+        second = work_queue.claim('worker-b')
+        self.assertEqual([task['id'] for task in second], [first[0]['id']])
+        self.assertEqual(second[0]['attempts'], 2)
+
+        self.assertFalse(work_queue.complete('worker-a', first[0]['id']), 'A worker completed a task it had lost')
+        self.assertTrue(work_queue.complete('worker-b', second[0]['id']))
+        self.assertEqual(work_queue.counts(), {DONE: 1})
+
+class UploadTestCase(unittest.TestCase):
+
+    """
+    Offline tests of the upload path, with SQLite and moto stand-ins for RDS and S3
+
+    Attributes
+    ----------
+    work_dir : str
+        Temporary directory the scraper saves to
+    previous_dir : str
+        Working directory before the test
+    scraper : Scraper
+        Scraper using the http engine, so no browser is started
+    """
+    def setUp(self) -> None:
+        """
+        Create a scraper working in a temporary directory with a SQLite database
+        """
+        self.previous_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+        self.scraper = scraper.Scraper("https://www.cardmarket.com", "Kamigawa-Neon-Dynasty", "NEO", True, "NEO_cardlist.txt", True, "raw_data.zip", "mtgscraperbucket", "localhost", False, engine="http")
+        self.scraper.database_access = f"sqlite:///{os.path.join(self.work_dir, 'rds.db')}"
+
+    def tearDown(self) -> None:
+        """
+        Close the scraper and delete its files
+        """
+        self.scraper.close()
+        os.chdir(self.previous_dir)
+        shutil.rmtree(self.work_dir)
+
+    @staticmethod
+    def make_dataframe(price_trend, card_count=3) -> pd.DataFrame:
+        """
+        Returns a dataframe of card_count NEO records all priced at price_trend
+        """
+        records = []
+        for set_number in range(1, card_count + 1):
+            record = MTGCardData(version_count=0)
+            record.card_name = f"Card {set_number}"
+            record.rarity = "Rare"
+            record.available_count = 10
+            record.set_number = set_number
+            record.price_trend = price_trend
+            record.image_url = f"https://example.com/{set_number:03d}.jpg"
+            record.image_key = f"NEO_{set_number:03d}"
+            record.uuid = f"uuid-{price_trend}-{set_number}"
+            records.append(record.to_tuple())
+        return pd.DataFrame.from_records(records, columns=MTGCardData.FIELDS)
+
+    def test_rds_upsert(self) -> None:
+        """
+        Uploading the same cards twice leaves one row per card holding the values of the second upload
+        """
+        self.assertTrue(self.scraper._upload_rds(self.make_dataframe(1.0)))
+        self.assertTrue(self.scraper._upload_rds(self.make_dataframe(2.5)))
+
+        engine = create_engine(self.scraper.database_access)
+        with engine.connect() as connection:
+            rows = connection.execute(text(f"SELECT image_key, price_trend, uuid, set_code FROM {self.scraper.table_name} ORDER BY image_key")).all()
+            tables = inspect(connection).get_table_names()
+        engine.dispose()
+        self.assertEqual([row[0] for row in rows], ['NEO_001', 'NEO_002', 'NEO_003'], 'Re-uploading duplicated rows')
+        self.assertTrue(all(row[1] == 2.5 and row[2].startswith('uuid-2.5') and row[3] == 'NEO' for row in rows), 'Rows were not updated')
+        self.assertEqual(tables, [self.scraper.table_name], 'A staging table was left behind')
+
+    def test_rds_migrates_appended_table(self) -> None:
+        """
+        A table filled by the old appending uploads keeps the last inserted row of each card when it is migrated
+        """
+        engine = create_engine(self.scraper.database_access)
+        self.make_dataframe(9.0, 1).to_sql(self.scraper.table_name, engine, if_exists='append')
+        self.make_dataframe(1.0, 1).to_sql(self.scraper.table_name, engine, if_exists='append')
+        self.assertEqual(self.scraper._remote_scraped_names(), {'Card 1'})
+
+        self.assertTrue(self.scraper._upload_rds(self.make_dataframe(2.5).iloc[1:]))
+        with engine.connect() as connection:
+            rows = connection.execute(text(f"SELECT image_key, price_trend FROM {self.scraper.table_name} ORDER BY image_key")).all()
+        engine.dispose()
+        self.assertEqual([tuple(row) for row in rows], [('NEO_001', 1.0), ('NEO_002', 2.5), ('NEO_003', 2.5)])
+
+    def test_s3_sync(self) -> None:
+        """
+        Files are uploaded under their set prefix, unchanged files are skipped using the manifest and changed ones are uploaded again
+        """
+        file_paths = []
+        for set_code in ('NEO', 'SNC'):
+            os.makedirs(os.path.join(self.scraper.root_save_dir, set_code))
+            file_path = os.path.join(self.scraper.root_save_dir, set_code, '001.json')
+            with open(file_path, 'w') as f:
+                json.dump({'set_code': set_code}, f)
+            file_paths.append(file_path)
+
+        credentials = {'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing', 'AWS_DEFAULT_REGION': 'eu-west-2'}
+        with mock.patch.dict(os.environ, credentials), mock_aws():
+            s3 = boto3.client('s3')
+            s3.create_bucket(Bucket=self.scraper.bucket_name, CreateBucketConfiguration={'LocationConstraint': 'eu-west-2'})
+
+            self.assertTrue(self.scraper._upload_s3_files(file_paths))
+            keys = sorted(item['Key'] for item in s3.list_objects_v2(Bucket=self.scraper.bucket_name)['Contents'])
+            self.assertEqual(keys, ['NEO/001.json', 'SNC/001.json'], 'Files of different sets share a key')
+
+            #Objects removed behind the manifest's back stay missing while their files are unchanged
+            s3.delete_object(Bucket=self.scraper.bucket_name, Key='NEO/001.json')
+            s3.delete_object(Bucket=self.scraper.bucket_name, Key='SNC/001.json')
+            with open(file_paths[1], 'w') as f:
+                json.dump({'set_code': 'SNC', 'changed': True}, f)
+            self.assertTrue(self.scraper._upload_s3_files(file_paths))
+            keys = sorted(item['Key'] for item in s3.list_objects_v2(Bucket=self.scraper.bucket_name).get('Contents', []))
+            self.assertEqual(keys, ['SNC/001.json'], 'Only the changed file should be uploaded again')
+
+class JsonParserTestCase(unittest.TestCase):
+
+    """
+    Tests of streaming target lists out of a small AllPrintings.json shaped file
+
+    Attributes
+    ----------
+    work_dir : str
+        Temporary directory holding the file
+    filepath : str
+        Path of the AllPrintings.json fixture
+    """
+    def setUp(self) -> None:
+        """
+        Write an AllPrintings.json with two sets, double faced cards, reprinted names and the booster and deck
+        lists that also have cards keys, keys sorted the way mtgjson writes them
+        """
+        self.work_dir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.work_dir, 'AllPrintings.json')
+        all_printings = {
+            "data": {
+                "NEO": {
+                    "booster": {"default": {"sheets": {"common": {"cards": {"booster-uuid": 10}}}}},
+                    "cards": [
+                        {"name": "Fable of the Mirror-Breaker // Reflection of Kiki-Jiki", "number": "141", "faceName": "Fable of the Mirror-Breaker"},
+                        {"name": "Fable of the Mirror-Breaker // Reflection of Kiki-Jiki", "number": "141", "faceName": "Reflection of Kiki-Jiki"},
+                        {"name": "Ancestral Katana", "number": "1", "artist": "Not kept"},
+                        {"name": "Island", "number": "295"},
+                        {"name": "Island", "number": "296"},
+                    ],
+                    "code": "NEO",
+                    "decks": [{"cards": [{"name": "Deck Only Card", "number": "900"}], "name": "Deck"}],
+                    "name": "Kamigawa: Neon Dynasty",
+                },
+                "SNC": {
+                    "cards": [{"name": "Ob Nixilis, the Adversary", "number": "206"}],
+                    "code": "SNC",
+                    "name": "Streets of New Capenna",
+                },
+            },
+            "meta": {"version": "5.2.0"},
+        }
+        with open(self.filepath, 'w') as f:
+            json.dump(all_printings, f)
+
+    def tearDown(self) -> None:
+        """
+        Delete the fixture
+        """
+        shutil.rmtree(self.work_dir)
+
+    def test_iter_sets(self) -> None:
+        """
+        Each set's cards are deduplicated by name with their face names, cards nested in boosters and decks are ignored
+        """
+        sets = json_parser.load_sets(self.filepath)
+        self.assertEqual(list(sets), ['NEO', 'SNC'])
+
+        neo = sets['NEO']
+        self.assertEqual(neo['name'], 'Kamigawa: Neon Dynasty')
+        self.assertEqual(neo['slug'], 'Kamigawa-Neon-Dynasty')
+        self.assertEqual(neo['cards'], ['Ancestral Katana', 'Fable of the Mirror-Breaker // Reflection of Kiki-Jiki', 'Island'])
+        self.assertEqual(neo['details']['Fable of the Mirror-Breaker // Reflection of Kiki-Jiki'],
+                         {'number': '141', 'face_names': ['Fable of the Mirror-Breaker', 'Reflection of Kiki-Jiki']})
+        self.assertEqual(neo['details']['Island'], {'number': '295', 'face_names': []}, 'A reprinted name should keep its first printing')
+        self.assertEqual(neo['details']['Ancestral Katana'], {'number': '1', 'face_names': []})
+        self.assertEqual(sets['SNC']['cards'], ['Ob Nixilis, the Adversary'])
+
+    def test_iter_sets_skips_unrequested_sets(self) -> None:
+        """
+        Only the requested sets are yielded
+        """
+        self.assertEqual([code for code, set_info in json_parser.iter_sets(self.filepath, ['SNC'])], ['SNC'])
+        self.assertEqual(list(json_parser.iter_sets(self.filepath, ['DMU'])), [])
+
+class CardExtractionTestCase(unittest.TestCase):
+
+    """
+    Tests of reading a product page into a record through FIELD_SPEC
+    """
+    PAGE = """<html><body>
+<h1>Fable of the Mirror-Breaker // Reflection of Kiki-Jiki<span>Kamigawa: Neon Dynasty Singles</span></h1>
+<div class="image card-image"><img class="is-front" src="/img/NEO/141.jpg"></div>
+<dl class="labeled row no-gutters mx-auto">
+<dt>Rarity</dt><dd><span class="icon" data-original-title="Rare"></span></dd>
+<dt>Number</dt><dd>141</dd>
+<dt>Printed in</dt><dd><a href="#">Kamigawa: Neon Dynasty</a></dd>
+<dt>Reprints</dt><dd><a href="#">Show Reprints</a></dd>
+<dt>Available items</dt><dd>1523</dd>
+<dt>From</dt><dd>54,90 €</dd>
+<dt>Price Trend</dt><dd><span>1.234,50 £</span></dd>
+<dt>30-days average price</dt><dd><span>63,12 €</span></dd>
+<dt>7-days average price</dt><dd><span>61,00 €</span></dd>
+<dt>1-day average price</dt><dd><span>60,50 €</span></dd>
+<dt>Sealed in</dt><dd>Not a field</dd>
+</dl>
+</body></html>"""
+
+    def test_extract_from_html(self) -> None:
+        """
+        Every row of the data table is read into its field, the name excludes the nested set name and the image url is absolute
+        """
+        extracted = card_extraction.extract_from_html(html.fromstring(self.PAGE), "https://www.cardmarket.com/en/Magic/Products/Singles/Kamigawa-Neon-Dynasty/Fable")
+        record = MTGCardData()
+        card_extraction.fill_record(record, extracted)
+        self.assertEqual(record.card_name, 'Fable of the Mirror-Breaker // Reflection of Kiki-Jiki')
+        self.assertEqual(record.image_url, 'https://www.cardmarket.com/img/NEO/141.jpg')
+        self.assertEqual(record.rarity, 'Rare')
+        self.assertEqual(record.set_number, 141)
+        self.assertEqual(record.version_count, 1, 'A card without a reprint count has one version')
+        self.assertEqual(record.available_count, 1523)
+        self.assertEqual(record.lowest_price, 54.90)
+        self.assertEqual(record.price_trend, 1234.50)
+        self.assertEqual(record.average_price_30_day, 63.12)
+        self.assertEqual(record.average_price_7_day, 61.00)
+        self.assertEqual(record.average_price_1_day, 60.50)
+
+    def test_parsers(self) -> None:
+        """
+        Prices, reprint counts and rarities are read the way cardmarket writes them
+        """
+        self.assertEqual(card_extraction.parse_price({'text': '0,02 €'}), 0.02)
+        self.assertEqual(card_extraction.parse_price({'text': '12,50 £'}), 12.5)
+        self.assertEqual(card_extraction.parse_reprints({'link': 'Show Reprints (3)'}), 3)
+        self.assertEqual(card_extraction.parse_reprints({'link': None}), 1)
+        self.assertEqual(card_extraction.parse_rarity({'title': 'Mythic'}), 'Mythic')
+
+    def test_missing_table(self) -> None:
+        """
+        A page without the data table, e.g. a captcha or error page, gives None
+        """
+        self.assertIsNone(card_extraction.extract_from_html(html.fromstring("<html><body><h1>Just a moment...</h1></body></html>"), "https://www.cardmarket.com"))
+
+class MTGCardDataTestCase(unittest.TestCase):
+
+    """
+    Tests of checking records against MTGCardData.SCHEMA
+    """
+    @staticmethod
+    def make_record(**fields) -> MTGCardData:
+        """
+        Returns a valid record with the given fields replaced
+        """
+        values = {
+            'card_name': 'Ancestral Katana', 'rarity': 'Common', 'available_count': 3000, 'version_count': 1, 'set_number': 1,
+            'lowest_price': 0.02, 'price_trend': 0.1, 'average_price_30_day': 0.1, 'average_price_7_day': 0.1, 'average_price_1_day': 0.1,
+            'image_url': 'https://example.com/001.jpg', 'image_key': 'NEO_001', 'uuid': 'uuid-1',
+        }
+        values.update(fields)
+        return MTGCardData(**values)
+
+    def test_valid_record(self) -> None:
+        """
+        A complete record passes and keeps its values
+        """
+        record = self.make_record()
+        record.validate()
+        self.assertEqual(record.to_dict(), self.make_record().to_dict())
+
+    def test_optional_fields(self) -> None:
+        """
+        Optional fields may be None, e.g. a card without sales
+        """
+        self.make_record(rarity=None, available_count=None, lowest_price=None, price_trend=None).validate()
+
+    def test_whole_prices_become_float(self) -> None:
+        """
+        Whole number prices are converted to float, counts are left as int
+        """
+        record = self.make_record(price_trend=2, available_count=5)
+        record.validate()
+        self.assertIsInstance(record.price_trend, float)
+        self.assertEqual(record.price_trend, 2.0)
+        self.assertIsInstance(record.available_count, int)
+
+    def test_missing_required_field(self) -> None:
+        """
+        A record without a required field is rejected
+        """
+        for name in ('card_name', 'set_number', 'image_url', 'image_key', 'uuid'):
+            with self.assertRaises(ValueError, msg=f'{name} should be required'):
+                self.make_record(**{name: None}).validate()
+
+    def test_wrong_type(self) -> None:
+        """
+        Values of the wrong type are rejected, including bools where numbers are expected and text where prices are
+        """
+        for fields in ({'set_number': '1'}, {'set_number': 1.5}, {'available_count': True}, {'price_trend': '0,10 €'}, {'price_trend': False}, {'card_name': 1}):
+            with self.assertRaises(ValueError, msg=f'{fields} should be rejected'):
+                self.make_record(**fields).validate()
+
+    def test_round_trip(self) -> None:
+        """
+        A record converted to a dict and back is unchanged and its tuple follows FIELDS
+        """
+        record = self.make_record()
+        self.assertEqual(MTGCardData.from_dict(dict(record.to_dict(), extra='ignored')).to_dict(), record.to_dict())
+        self.assertEqual(record.to_tuple(), tuple(record.to_dict()[name] for name in MTGCardData.FIELDS))
+
+class FixtureScrapeTestCase(unittest.TestCase):
+
+    """
+    Offline tests of scraping and saving, against the benchmark's fixture server standing in for cardmarket
+
+    Attributes
+    ----------
+    work_dir : str
+        Temporary directory the scraper saves to
+    previous_dir : str
+        Working directory before the test
+    server : FixtureServer
+        Server of the fixture pages and images
+    card_names : list[str]
+        Cards of the fixture set
+    scraper : Scraper
+        Scraper using the http engine, so no browser is started
+    """
+    def setUp(self) -> None:
+        """
+        Start the fixture server and create a scraper of its set working in a temporary directory
+        """
+        self.previous_dir = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+        pages = synthetic_pages(4)
+        self.card_names = list(pages)
+        self.server = FixtureServer(pages)
+        server_url = self.server.start()
+        with open('cardlist.txt', 'w') as f:
+            f.write('\n'.join(self.card_names) + '\n')
+        self.scraper = scraper.Scraper(server_url, "Benchmark-Set", "BEN", True, 'cardlist.txt', False, "raw_data.zip", "mtgscraperbucket", "localhost", False, engine="http")
+        self.scraper.retry_backoff = 0
+        self.scraper.rate_limiter = RateLimiter(rate=100, max_rate=100, burst=4, jitter=0, target_latency=60)
+
+    def tearDown(self) -> None:
+        """
+        Stop the server, close the scraper and delete its files
+        """
+        self.server.stop()
+        self.scraper.close()
+        os.chdir(self.previous_dir)
+        shutil.rmtree(self.work_dir)
+
+    def card_urls(self) -> list:
+        """
+        Returns the product page urls of the fixture set, the way run() builds them
+        """
+        url_head = self.scraper.url_base + self.scraper.url_mtg_section + self.scraper.url_set_name + "/"
+        return [url_head + card_name.replace(' ', '-') for card_name in self.card_names]
+
+    def scrape_and_save(self) -> None:
+        """
+        Scrape every card of the fixture set into a new journal and save the records, with the scraper's output hidden
+
+        run() would skip cards that are already saved, so the cards are scraped one by one with the http engine
+        """
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.scraper.journal.reset()
+            for url in self.card_urls():
+                self.assertTrue(self.scraper._scrape_http(url), f'Could not scrape {url}')
+            self.scraper.save()
+
+    def saved_records(self) -> dict:
+        """
+        Returns card name -> record of the set's data.json
+        """
+        with open(os.path.join(self.scraper.root_save_dir, self.scraper.set_code, self.scraper.json_filename), 'r') as f:
+            return {record['card_name']: record for record in json.load(f)}
+
+    def test_change_detection(self) -> None:
+        """
+        Saving identical records again changes nothing and keeps their uuids, a price change is saved and is the only row uploaded
+        """
+        self.scrape_and_save()
+        self.assertEqual(self.scraper.change_summary, {'new': 4, 'changed': 0, 'unchanged': 0})
+        first = self.saved_records()
+
+        self.scrape_and_save()
+        self.assertEqual(self.scraper.change_summary, {'new': 0, 'changed': 0, 'unchanged': 4})
+        self.assertEqual(self.saved_records(), first, 'An unchanged record was rewritten or given a new uuid')
+        self.scraper._create_dataframe()
+        self.assertEqual(len(self.scraper.dataframe), 0, 'Unchanged records would be uploaded')
+
+        changed_name = self.card_names[1]
+        slug = changed_name.replace(' ', '-')
+        self.server.pages[slug] = re.sub(rb'(Price Trend</dt><dd[^>]*><span>)[^<]*', '\\g<1>999,99 €'.encode(), self.server.pages[slug])
+        self.scrape_and_save()
+        self.assertEqual(self.scraper.change_summary, {'new': 0, 'changed': 1, 'unchanged': 3})
+        saved = self.saved_records()
+        self.assertEqual(saved[changed_name]['price_trend'], 999.99)
+        self.assertNotEqual(saved[changed_name]['uuid'], first[changed_name]['uuid'], 'A changed record kept its old uuid')
+        self.scraper._create_dataframe()
+        self.assertEqual(list(self.scraper.dataframe['card_name']), [changed_name])
+        self.assertEqual(list(self.scraper.dataframe['price_trend']), [999.99])
+
+    def test_replay_reproduces_scrape(self) -> None:
+        """
+        Replaying the archived pages with the server stopped gives the records of the live scrape, apart from their uuids
+        """
+        self.scrape_and_save()
+        live = [{key: value for key, value in record.items() if key != 'uuid'} for record in self.scraper.journal.records()]
+        saved = self.saved_records()
+        self.server.stop()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.scraper.replay()
+            replayed = self.scraper.journal.records()
+            self.scraper.save()
+        self.assertEqual(len(replayed), len(self.card_names))
+        self.assertEqual([{key: value for key, value in record.items() if key != 'uuid'} for record in replayed], live)
+        self.assertEqual(self.saved_records(), saved, 'A replay changed the saved records')
+        with open(os.path.join(self.scraper.replay_dir, self.scraper.set_code, self.scraper.json_filename), 'r') as f:
+            self.assertEqual(len(json.load(f)['records']), len(self.card_names))
+
+    def test_resume_after_crash(self) -> None:
+        """
+        Resuming skips the cards already in the journal and scrapes again the card whose line was torn by the crash
+        """
+        urls = self.card_urls()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.scraper.journal.reset()
+            for url in urls[:2]:
+                self.assertTrue(self.scraper._scrape_http(url))
+        journaled = {record['card_name']: record['uuid'] for record in self.scraper.journal.records()}
+        with open(self.scraper.journal.filepath, 'a') as f:
+            f.write('{"url": "' + urls[2] + '", "record": {"card_na')    #The crash cut the third card's line short
+        self.assertEqual(self.scraper.journal.completed_urls(), set(urls[:2]))
+
+        requests = self.server.requests
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.scraper.run(resume=True)
+        self.assertEqual(self.server.requests - requests, 2, 'Journaled cards were scraped again')
+        records = self.scraper.journal.records()
+        self.assertEqual([record['card_name'] for record in records], self.card_names)
+        self.assertEqual({record['card_name']: record['uuid'] for record in records[:2]}, journaled)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.scraper.save()
+        self.assertEqual(self.scraper.change_summary, {'new': 4, 'changed': 0, 'unchanged': 0})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
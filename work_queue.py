@@ -0,0 +1,224 @@
+import time
+
+from sqlalchemy import MetaData, Table, Column, Integer, Float, Text, Index, text, bindparam
+
+#Statuses a task moves through, leased tasks whose lease has expired are claimable again
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+class WorkQueue:
+    """
+    Database-backed queue of (set, card slug) scrape tasks that several scraper processes or containers can claim from
+
+    A claimed task is leased to one worker until lease_expires, which the worker extends with heartbeat() while it scrapes.
+    Tasks of a crashed worker become claimable again once their lease expires. Claims are compare-and-set updates, so they
+    work the same on PostgreSQL and SQLite without row locks
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        Engine of the database holding the queue
+    table_name : str
+        Name of the task table
+    lease_seconds : float
+        How long a claim or heartbeat keeps a task leased
+    max_attempts : int
+        Number of claims after which a task that keeps failing or expiring is marked failed
+
+    Attributes
+    ----------
+    tasks : sqlalchemy.Table
+        The task table
+    """
+
+    def __init__(self, engine, table_name="mtgscraper_tasks", lease_seconds=300, max_attempts=3) -> None:
+        self.engine = engine
+        self.table_name = table_name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        metadata = MetaData()
+        self.tasks = Table(
+            table_name, metadata,
+            Column('id', Integer, primary_key=True, autoincrement=True),
+            Column('set_code', Text, nullable=False),
+            Column('set_slug', Text, nullable=False),
+            Column('card_slug', Text, nullable=False),
+            Column('status', Text, nullable=False, default=PENDING),
+            Column('worker', Text),
+            Column('lease_expires', Float),
+            Column('attempts', Integer, nullable=False, default=0),
+            Column('last_error', Text),
+            Column('updated_at', Float),
+            Index(f'{table_name}_set_card_idx', 'set_code', 'card_slug', unique=True),
+            Index(f'{table_name}_status_idx', 'status', 'lease_expires'),
+        )
+
+    def create(self) -> None:
+        """
+        Creates the task table if it doesn't exist
+        """
+        self.tasks.metadata.create_all(self.engine)
+
+    def enqueue(self, set_code, set_slug, card_slugs) -> None:
+        """
+        Adds the cards of a set to the queue, putting back cards that are done or failed from an earlier run and leaving queued or leased ones alone
+
+        Parameters
+        ----------
+        set_code : str
+            MTG three letter expansion code of the set
+        set_slug : str
+            MTG set name in url format for cardmarket
+        card_slugs : list[str]
+            Card names in url format
+        """
+        now = time.time()
+        rows = [{'set_code': set_code, 'set_slug': set_slug, 'card_slug': card_slug, 'now': now} for card_slug in card_slugs]
+        if not rows:
+            return
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                f"INSERT INTO {self.table_name} (set_code, set_slug, card_slug, status, attempts, updated_at) "
+                f"VALUES (:set_code, :set_slug, :card_slug, '{PENDING}', 0, :now) "
+                f"ON CONFLICT (set_code, card_slug) DO UPDATE SET status = '{PENDING}', set_slug = excluded.set_slug, attempts = 0, "
+                f"worker = NULL, lease_expires = NULL, last_error = NULL, updated_at = excluded.updated_at "
+                f"WHERE {self.table_name}.status IN ('{DONE}', '{FAILED}')"), rows)
+
+    def _claimable(self) -> str:
+        """
+        Returns the SQL condition of a task another worker may claim, with :now and :max_attempts parameters
+        """
+        return (f"(status = '{PENDING}' OR (status = '{LEASED}' AND lease_expires < :now)) AND attempts < :max_attempts")
+
+    def claim(self, worker, limit=1, set_code=None) -> list:
+        """
+        Leases up to limit claimable tasks to worker
+
+        Parameters
+        ----------
+        worker : str
+            Unique id of the claiming worker
+        limit : int
+            Maximum number of tasks to claim
+        set_code : str
+            Only claim tasks of this set if given
+
+        Returns
+        -------
+        list[dict]
+            id, set_code, set_slug, card_slug and attempts of every claimed task, oldest first
+        """
+        self.reap()
+        claimed = []
+        set_filter = " AND set_code = :set_code" if set_code is not None else ""
+        while len(claimed) < limit:
+            now = time.time()
+            params = {'now': now, 'max_attempts': self.max_attempts, 'set_code': set_code, 'limit': limit - len(claimed)}
+            with self.engine.begin() as connection:
+                candidates = connection.execute(text(
+                    f"SELECT id, set_code, set_slug, card_slug, attempts FROM {self.table_name} "
+                    f"WHERE {self._claimable()}{set_filter} ORDER BY id LIMIT :limit"), params).mappings().all()
+            if not candidates:
+                break
+            for candidate in candidates:
+                #Only one worker's update can still see the task as claimable
+                with self.engine.begin() as connection:
+                    result = connection.execute(text(
+                        f"UPDATE {self.table_name} SET status = '{LEASED}', worker = :worker, lease_expires = :lease_expires, "
+                        f"attempts = attempts + 1, updated_at = :now WHERE id = :id AND {self._claimable()}"),
+                        {'worker': worker, 'lease_expires': now + self.lease_seconds, 'now': now, 'id': candidate['id'], 'max_attempts': self.max_attempts})
+                if result.rowcount == 1:
+                    claimed.append({**candidate, 'attempts': candidate['attempts'] + 1})
+        return claimed
+
+    def heartbeat(self, worker, task_ids) -> int:
+        """
+        Extends the lease of tasks worker still holds and returns how many it still holds
+
+        Parameters
+        ----------
+        worker : str
+            Unique id of the worker
+        task_ids : list[int]
+            Ids of the tasks to extend
+        """
+        if not task_ids:
+            return 0
+        now = time.time()
+        with self.engine.begin() as connection:
+            result = connection.execute(text(
+                f"UPDATE {self.table_name} SET lease_expires = :lease_expires, updated_at = :now "
+                f"WHERE id IN :ids AND worker = :worker AND status = '{LEASED}'").bindparams(bindparam('ids', expanding=True)),
+                {'lease_expires': now + self.lease_seconds, 'now': now, 'ids': list(task_ids), 'worker': worker})
+        return result.rowcount
+
+    def complete(self, worker, task_id) -> bool:
+        """
+        Marks a task done, returning False if worker had lost its lease to another worker
+
+        Parameters
+        ----------
+        worker : str
+            Unique id of the worker
+        task_id : int
+            Id of the task
+        """
+        with self.engine.begin() as connection:
+            result = connection.execute(text(
+                f"UPDATE {self.table_name} SET status = '{DONE}', lease_expires = NULL, last_error = NULL, updated_at = :now "
+                f"WHERE id = :id AND worker = :worker AND status = '{LEASED}'"),
+                {'now': time.time(), 'id': task_id, 'worker': worker})
+        return result.rowcount == 1
+
+    def fail(self, worker, task_id, error, retry=True) -> bool:
+        """
+        Gives a task back to the queue if it may be retried and has attempts left, otherwise marks it failed
+
+        Parameters
+        ----------
+        worker : str
+            Unique id of the worker
+        task_id : int
+            Id of the task
+        error : str
+            Description of the failure
+        retry : bool
+            Whether the failure is worth retrying
+        """
+        with self.engine.begin() as connection:
+            result = connection.execute(text(
+                f"UPDATE {self.table_name} SET status = CASE WHEN :retry AND attempts < :max_attempts THEN '{PENDING}' ELSE '{FAILED}' END, "
+                f"worker = NULL, lease_expires = NULL, last_error = :error, updated_at = :now "
+                f"WHERE id = :id AND worker = :worker AND status = '{LEASED}'"),
+                {'retry': retry, 'max_attempts': self.max_attempts, 'error': error, 'now': time.time(), 'id': task_id, 'worker': worker})
+        return result.rowcount == 1
+
+    def reap(self) -> int:
+        """
+        Marks tasks failed whose lease expired on their last attempt, e.g. cards that crash every worker that takes them, and returns how many
+        """
+        now = time.time()
+        with self.engine.begin() as connection:
+            result = connection.execute(text(
+                f"UPDATE {self.table_name} SET status = '{FAILED}', worker = NULL, lease_expires = NULL, "
+                f"last_error = 'lease expired on final attempt', updated_at = :now "
+                f"WHERE status = '{LEASED}' AND lease_expires < :now AND attempts >= :max_attempts"),
+                {'now': now, 'max_attempts': self.max_attempts})
+        return result.rowcount
+
+    def counts(self, set_code=None) -> dict:
+        """
+        Returns the number of tasks in each status
+
+        Parameters
+        ----------
+        set_code : str
+            Only count tasks of this set if given
+        """
+        set_filter = " WHERE set_code = :set_code" if set_code is not None else ""
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(
+                f"SELECT status, COUNT(*) FROM {self.table_name}{set_filter} GROUP BY status"), {'set_code': set_code}).all()
+        return {status: count for status, count in rows}